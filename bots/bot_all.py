@@ -0,0 +1,25 @@
+"""
+Runs every feed listed in bots.json (or only the ones given on the command line) in a
+single process, with a single Lemmy login, instead of one bots/bot_*.py script per feed.
+
+    python bots/bot_all.py            # all feeds
+    python bots/bot_all.py til gifs   # only these feeds
+    python bots/bot_all.py --daemon   # keep running, polling every feed on its own schedule
+"""
+import argparse
+
+from repost import main, run_daemon
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repost every feed of bots.json to lemmy.")
+    parser.add_argument("feeds", nargs="*", help="Names of the feeds to run (default: all)")
+    parser.add_argument("--config", type=str, default="bots.json", help="Path to the bot configuration")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and poll every feed every poll_interval_minutes")
+
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon(args.feeds or None, config_path=args.config)
+    else:
+        main(args.feeds or None, config_path=args.config)
@@ -1,15 +1,57 @@
+"""
+Watches a community for "@partybot deleteThis!" comments and deletes a post once enough users
+asked for it.
+
+All the requests go through one pooled requests.Session. The comments of the whole community
+are listed newest first, page by page, and only down to the highest comment id already handled,
+so a run only reads the comments posted since the previous one, whatever the post they were
+made on. Every request is folded into a ledger of votes keyed by (post, user) that persists
+across runs (see del_votes.py); a post is deleted once it has DELETE_THRESHOLD votes, and is
+then marked so that its later requests are ignored. Requests older than VOTE_TTL_DAYS are
+ignored, and a new ledger only records the newest id of every listing, so the requests made
+before the bot first ran are never acted on.
+
+The name of the user behind a request is taken from the `creator` embedded in the comment
+list. Only when it is missing is the user looked up, all the missing ones of a scan at once,
+and the names are cached in the ledger for USER_CACHE_TTL (at most USER_CACHE_SIZE users, the
+least recently used are dropped first).
+
+With `--mode inbox`, the requests are read from the inbox of the bot instead: its mentions
+(GET /user/mention) and the replies to its comments and posts (GET /user/replies), each listed
+down to its own high-water mark, so the number of requests grows with the number of requests
+to the bot rather than with the activity of the community. Lemmy only notifies a mention
+written in full (`@partybot@lemmy.ca deleteThis!`), which is accepted as well. The inbox is
+left unread for the owner of the account. LEMMY_API_BASE_URL can point the bot to another
+instance, e.g. a local stand-in API for testing.
+"""
+import argparse
 import requests
 import os
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
-LEMMY_API_BASE_URL = "https://lemmy.ca/api/v3"
+from requests.adapters import HTTPAdapter
+
+from del_votes import DeleteVoteLedger
+
+LEMMY_API_BASE_URL = os.getenv("LEMMY_API_BASE_URL", "https://lemmy.ca/api/v3")
 community_name = "botland"  # Update this to the community name
 USERNAME_TO_WATCH = "@partybot"
 LEMMY_USERNAME = os.getenv("LEMMY_USERNAME")
 LEMMY_PASSWORD = os.getenv("LEMMY_PASSWORD")
+LEDGER_PATH = "del_req_state.db"
+DELETE_THRESHOLD = 3
+VOTE_TTL_DAYS = 30
+COMMENTS_PER_PAGE = 50
+# Most pages of a listing read in a run (the first run only reads the newest items)
+MAX_PAGES = 20
+MAX_WORKERS = 8
+USER_CACHE_TTL = 24 * 3600
+USER_CACHE_SIZE = 1000
 
-# Dictionary to track delete requests from users
-delete_requests = {}
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
 
 def authenticate():
     url = f"{LEMMY_API_BASE_URL}/user/login"
@@ -17,70 +59,178 @@ def authenticate():
         "username_or_email": LEMMY_USERNAME,
         "password": LEMMY_PASSWORD
     }
-    response = requests.post(url, json=data)
+    response = session.post(url, json=data)
     if response.status_code == 200:
         return response.json()["jwt"]
     else:
         print(f"Authentication failed: {response.status_code}")
         return None
 
-def get_recent_posts(auth_token, community_name):
-    url = f"{LEMMY_API_BASE_URL}/post/list"
-    headers = {
-        "Authorization": f"Bearer {auth_token}"
-    }
-    params = {
-        "community_name": community_name,
-        "sort": "New",
-        "limit": 10,
-        "deleted": "false"
-    }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json()["posts"]
+def to_epoch(published):
+    published = datetime.fromisoformat(published.replace("Z", "+00:00"))
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return int(published.timestamp())
+
+def fetch_since(auth_token, path, params, items_key, item_id, since_id=0):
+    """
+    Fetch the items of the listing `path` with an id (as returned by `item_id`) above
+    `since_id`, oldest first. The items are listed newest first, so the pages stop as soon as
+    an already handled item shows up (or after MAX_PAGES pages). Returns None if the items
+    could not be fetched.
+    """
+    url = f"{LEMMY_API_BASE_URL}{path}"
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    params = dict(params, sort="New", limit=COMMENTS_PER_PAGE, page=1)
+
+    new_items = []
+    while True:
+        response = session.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Failed to fetch {path}: {response.status_code}")
+            return None
+
+        items = response.json()[items_key]
+        new_items.extend(item for item in items if item_id(item) > since_id)
+        if len(items) < COMMENTS_PER_PAGE or any(item_id(item) <= since_id for item in items):
+            break
+        if params["page"] >= MAX_PAGES:
+            print(f"Stopped after {MAX_PAGES} pages of {path}, the older items are skipped")
+            break
+        params["page"] += 1
+
+    new_items.sort(key=item_id)
+    return new_items
+
+def fetch_new_comments(auth_token, community_name, since_id=0):
+    """
+    Fetch the comments of the community with an id above `since_id`, oldest first
+    """
+    return fetch_since(
+        auth_token,
+        "/comment/list",
+        {"community_name": community_name, "type_": "All"},
+        "comments",
+        lambda c: c["comment"]["id"],
+        since_id,
+    )
+
+# Listings of the inbox: path, key of the items, id of an item, key of its high-water mark
+INBOX_LISTINGS = (
+    ("/user/mention", "mentions", lambda m: m["person_mention"]["id"], "max_mention_id"),
+    ("/user/replies", "replies", lambda r: r["comment_reply"]["id"], "max_reply_id"),
+)
+
+def fetch_newest_ids(auth_token, mode):
+    """
+    Highest id of the newest page of every listing read in `mode`, by key of its high-water
+    mark, or None if a listing could not be fetched
+    """
+    if mode == "inbox":
+        listings = [(path, {"unread_only": "false"}, items_key, item_id, key) for path, items_key, item_id, key in INBOX_LISTINGS]
     else:
-        print(f"Failed to fetch posts: {response.status_code}, {response.json()}")
-        print(f"Request URL: {url}")
-        print(f"Request Headers: {headers}")
-        print(f"Request Params: {params}")
-        return []
-
-def check_for_delete_mentions(post, auth_token):
-    post_id = post["post"]["id"]
-    community_name = post["community"]["name"]
-    
-    url = f"{LEMMY_API_BASE_URL}/comment/list?post_id={post_id}&community_name={community_name}"
+        listings = [(
+            "/comment/list", {"community_name": community_name, "type_": "All"}, "comments",
+            lambda c: c["comment"]["id"], "max_comment_id",
+        )]
+
     headers = {"Authorization": f"Bearer {auth_token}"}
-    
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        comments_data = response.json()["comments"]
-        
-        # Check each comment for delete requests
-        count = 0
-        for comment_data in comments_data:
-            comment = comment_data["comment"]  # Access the nested comment data
-            comment_id = comment["id"]
-            comment_content = comment["content"]
-            creator_id = comment["creator_id"]  # Access the ID of the comment creator
-            
-            if comment_content == f"{USERNAME_TO_WATCH} deleteThis!":
-                # Check if user has already requested to delete within the last hour
-                if creator_id not in delete_requests or datetime.now() - delete_requests[creator_id] > timedelta(hours=1):
-                    delete_requests[creator_id] = datetime.now()
-                    count += 1
-                    user_info = get_user_info(auth_token, creator_id)
-                    if user_info:
-                        post_confirmation_reply(post_id, remaining=0, auth_token=auth_token, user_id=creator_id, user_name=user_info.get("name"), already_requested=True)
-                else:
-                    # If user has already requested, reply with a message indicating so
-                    user_info = get_user_info(auth_token, creator_id)
-                    if user_info:
-                        post_confirmation_reply(post_id, remaining=0, auth_token=auth_token, user_id=creator_id, user_name=user_info.get("name"), already_requested=True)
-        return count, post_id  # Return post_id along with the count
-    
-    return 0, None  # Return None if post_id not found
+    high_waters = {}
+    for path, params, items_key, item_id, key in listings:
+        params = dict(params, sort="New", limit=COMMENTS_PER_PAGE, page=1)
+        response = session.get(f"{LEMMY_API_BASE_URL}{path}", headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Failed to fetch {path}: {response.status_code}")
+            return None
+        items = response.json()[items_key]
+        if items:
+            high_waters[key] = max(item_id(item) for item in items)
+
+    return high_waters
+
+def fetch_inbox(auth_token, ledger):
+    """
+    Fetch the new mentions and replies of the bot, concurrently. Returns the comments of the
+    community among them, oldest first, and the new high-water marks, or (None, {}) if the
+    inbox could not be fetched.
+    """
+    since_ids = [ledger.high_water(key) for _, _, _, key in INBOX_LISTINGS]
+    with ThreadPoolExecutor(max_workers=len(INBOX_LISTINGS)) as executor:
+        listings = list(executor.map(
+            lambda listing, since_id: fetch_since(
+                auth_token, listing[0], {"unread_only": "false"}, listing[1], listing[2], since_id
+            ),
+            INBOX_LISTINGS,
+            since_ids,
+        ))
+    if any(items is None for items in listings):
+        return None, {}
+
+    high_waters = {}
+    comments = {}
+    for (_, _, item_id, key), items in zip(INBOX_LISTINGS, listings):
+        if items:
+            high_waters[key] = item_id(items[-1])
+        for item in items:
+            # A reply mentioning the bot is in both listings
+            if item["community"]["name"] == community_name:
+                comments[item["comment"]["id"]] = item
+
+    return [comments[comment_id] for comment_id in sorted(comments)], high_waters
+
+def is_delete_request(comment_data):
+    mention, _, command = comment_data["comment"]["content"].strip().partition(" ")
+    return command.strip() == "deleteThis!" and (
+        mention == USERNAME_TO_WATCH or mention.startswith(f"{USERNAME_TO_WATCH}@")
+    )
+
+def resolve_user_names(auth_token, comments_data, ledger):
+    """
+    Return a dict of creator id -> name for the authors of `comments_data`, from the `creator`
+    of the comments, then from the names cached in the ledger, and looking up the remaining
+    users concurrently
+    """
+    names = {}
+    for comment_data in comments_data:
+        creator = comment_data.get("creator") or {}
+        if creator.get("name"):
+            names[comment_data["comment"]["creator_id"]] = creator["name"]
+    fetched = set(names)
+
+    creator_ids = {comment_data["comment"]["creator_id"] for comment_data in comments_data}
+    cached = ledger.user_names(creator_ids - fetched, USER_CACHE_TTL)
+    names.update(cached)
+
+    missing = list(creator_ids - set(names))
+    if missing:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for creator_id, user_info in zip(missing, executor.map(lambda i: get_user_info(auth_token, i), missing)):
+                if user_info:
+                    names[creator_id] = user_info.get("name")
+                    fetched.add(creator_id)
+
+    ledger.save_user_names(names, fetched, USER_CACHE_SIZE)
+    return names
+
+def check_for_delete_mentions(ledger, auth_token, comments_data, user_names):
+    """
+    Fold the delete requests of `comments_data` into the ledger. Returns the ids of the posts
+    that got requests, with the number of new votes of each.
+    """
+    new_votes = {}
+    for comment_data in comments_data:
+        comment = comment_data["comment"]
+        post_id = comment["post_id"]
+        creator_id = comment["creator_id"]
+
+        new_votes.setdefault(post_id, 0)
+        if ledger.add_vote(post_id, creator_id, comment["id"], to_epoch(comment["published"])):
+            new_votes[post_id] += 1
+        # Acknowledge the request, and tell the users asking again that they already did
+        if creator_id in user_names:
+            post_confirmation_reply(post_id, remaining=0, auth_token=auth_token, user_id=creator_id, user_name=user_names[creator_id], already_requested=True)
+
+    return new_votes
 
 def post_confirmation_reply(post_id, remaining, auth_token, user_id, user_name, already_requested=False):
     if post_id:
@@ -98,7 +248,7 @@ def post_confirmation_reply(post_id, remaining, auth_token, user_id, user_name,
         }
         
         print("Data sent for comment creation:", data)  # Print out the request data
-        response = requests.post(url, headers=headers, json=data)
+        response = session.post(url, headers=headers, json=data)
         print("Response content:", response.content)  # Print out the response content
         
         if response.status_code == 200:
@@ -117,41 +267,95 @@ def delete_post(post_id, auth_token):
         "deleted": True,
         "post_id": post_id
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = session.post(url, headers=headers, json=data)
     if response.status_code == 200:
         print(f"Deleted post {post_id}")
+        return True
     else:
         print(f"Failed to delete post {post_id}: {response.status_code}")
+        return False
 
 def get_user_info(auth_token, user_id):
-    url = f"{LEMMY_API_BASE_URL}/user/byId/{user_id}"
+    url = f"{LEMMY_API_BASE_URL}/user"
     headers = {"Authorization": f"Bearer {auth_token}"}
+    params = {"person_id": user_id, "limit": 1}
     
-    response = requests.get(url, headers=headers)
+    response = session.get(url, headers=headers, params=params)
     
     if response.status_code == 200:
-        return response.json().get("user")
+        return response.json()["person_view"]["person"]
     else:
         print(f"Failed to fetch user info for user ID {user_id}: {response.status_code}")
         return None
 
-def monitor_community():
+def monitor_community(mode="community"):
+    """
+    mode: "community" to read the requests from the comments of the community, "inbox" from
+    the mentions and replies of the bot
+    """
     auth_token = authenticate()
-    if auth_token:
-        posts = get_recent_posts(auth_token, community_name)
-        for post in posts:
-            count, post_id, user_id, user_name = check_for_delete_mentions(post, auth_token)  # Get post_id, user_id, and user_name
-            if isinstance(count, int):  # Check if count is an integer (i.e., not an error message)
-                if count >= 3:
-                    delete_post(post_id, auth_token)
-                elif count > 0:
-                    remaining = 3 - count
-                    post_confirmation_reply(post_id, remaining, auth_token, user_id, user_name)
-            else:
-                print("Error occurred while processing delete requests:", count)
+    if not auth_token:
+        return
+
+    with DeleteVoteLedger(LEDGER_PATH) as ledger:
+        if ledger.is_new:
+            # Start after the newest items: the requests of the history are not acted on
+            high_waters = fetch_newest_ids(auth_token, mode)
+            if high_waters is None:
+                return
+            for key, value in high_waters.items():
+                ledger.set_high_water(key, value)
+            print(f"Started a new ledger after {high_waters}")
+            return
+
+        # Expire the old votes first, so that they are not counted anymore
+        removed = ledger.remove_older_than(VOTE_TTL_DAYS)
+        if removed:
+            print(f"Removed {removed} votes older than {VOTE_TTL_DAYS} days")
+
+        if mode == "inbox":
+            comments_data, high_waters = fetch_inbox(auth_token, ledger)
+        else:
+            comments_data = fetch_new_comments(auth_token, community_name, ledger.max_comment_id())
+            high_waters = {"max_comment_id": comments_data[-1]["comment"]["id"]} if comments_data else {}
+        if comments_data is None:
+            return
+
+        # The requests on posts that are gone or were already deleted by the bot, and the
+        # expired ones, are ignored
+        cutoff = time.time() - 86400 * VOTE_TTL_DAYS
+        requests_data = [
+            c for c in comments_data
+            if is_delete_request(c) and to_epoch(c["comment"]["published"]) > cutoff
+            and not c["post"]["deleted"] and not ledger.is_closed(c["post"]["id"])
+        ]
+        user_names = resolve_user_names(auth_token, requests_data, ledger)
+
+        new_votes = check_for_delete_mentions(ledger, auth_token, requests_data, user_names)
+        for post_id, count in new_votes.items():
+            # The votes of the previous runs count as well
+            votes = ledger.vote_count(post_id)
+            if votes < DELETE_THRESHOLD and count > 0:
+                post_confirmation_reply(post_id, DELETE_THRESHOLD - votes, auth_token, None, None)
+
+        # Delete the posts that reached the threshold, including the ones whose deletion failed
+        # on a previous run
+        for post_id in ledger.posts_to_delete(DELETE_THRESHOLD):
+            if delete_post(post_id, auth_token):
+                ledger.close_post(post_id)
+
+        for key, value in high_waters.items():
+            ledger.set_high_water(key, value)
 
 if __name__ == "__main__":
-    monitor_community()
+    parser = argparse.ArgumentParser(description="Delete the posts that enough users asked the bot to delete")
+    parser.add_argument(
+        "--mode", choices=("community", "inbox"), default="community",
+        help="Read the requests from the comments of the community or from the inbox of the bot",
+    )
+    args = parser.parse_args()
+
+    monitor_community(args.mode)
 
 
 
@@ -0,0 +1,245 @@
+"""
+Compact in-memory index of the reddit entries that were already published.
+
+Instead of a dict of full permalinks (each with its own {"published_time": ...} dict), the
+index keeps a 64-bit hash of every normalized permalink and its published time (epoch
+seconds) in two parallel arrays sorted by hash, i.e. 12 bytes per entry. Lookups are a
+bisect over the sorted hashes. An optional Bloom filter can be put in front, so that links
+that were never published are usually rejected without touching the arrays; it is off by
+default because in pure Python its k bit probes cost more than the bisect they avoid.
+
+Expiry is lazy: the published times are also kept sorted in a third array (4 more bytes per
+entry), so remove_older_than() only moves the cutoff and bisects that array to count the
+entries it expires, and the lookups ignore the entries at or before the cutoff. The expired
+entries are only dropped from the arrays once they make up a quarter of them.
+"""
+import hashlib
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, compress
+
+
+def normalize_permalink(link):
+    """
+    Normalize a reddit permalink, so that the same post always hashes to the same value
+    """
+    # Plain string operations, as urllib.parse.urlsplit() would dominate the cost of a lookup
+    _, sep, rest = link.strip().partition("://")
+    if not sep:
+        rest = link.strip()
+    rest = rest.partition("#")[0].partition("?")[0]
+    host, _, path = rest.partition("/")
+    return f"{host.lower()}/{path}".rstrip("/")
+
+def hash_permalink(link):
+    """
+    64-bit hash of the normalized permalink
+    """
+    digest = hashlib.blake2b(normalize_permalink(link).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        capacity: Number of hashes the filter is sized for
+        error_rate: False positive rate once `capacity` hashes have been added
+        """
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, h):
+        # Double hashing: derive the k bit positions from the two halves of the 64-bit hash
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.num_hashes)]
+
+    def add(self, h):
+        bits = self.bits
+        for pos in self._positions(h):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, h):
+        bits = self.bits
+        for pos in self._positions(h):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class DedupIndex:
+    def __init__(self, use_bloom=False, bloom_error_rate=0.01):
+        """
+        use_bloom: Put a Bloom filter in front of the sorted arrays
+        bloom_error_rate: False positive rate of the Bloom filter
+        """
+        self.use_bloom = use_bloom
+        self.bloom_error_rate = bloom_error_rate
+
+        self._hashes = array("Q")
+        self._times = array("I")
+        # The times of the arrays, sorted
+        self._sorted_times = array("I")
+        # The entries published at or before the cutoff are expired, the first `_expired` of
+        # `_sorted_times`
+        self._cutoff = -1
+        self._expired = 0
+        # Recently added entries, merged into the sorted arrays in batches
+        self._pending = {}
+        self._bloom = None
+        self._rebuild_bloom()
+
+    def __len__(self):
+        if self._pending:
+            self._merge()
+        return len(self._hashes) - self._expired
+
+    def _find(self, h):
+        i = bisect_left(self._hashes, h)
+        if i < len(self._hashes) and self._hashes[i] == h:
+            return i
+        return -1
+
+    def _rebuild_bloom(self):
+        if not self.use_bloom:
+            return
+
+        self._bloom = BloomFilter(max(2 * (len(self._hashes) + len(self._pending)), 1024), self.bloom_error_rate)
+        for h in self._hashes:
+            self._bloom.add(h)
+        for h in self._pending:
+            self._bloom.add(h)
+
+    def _merge(self):
+        if not self._pending:
+            return
+
+        # Copy the runs of the sorted arrays between the insertion points of the (sorted)
+        # pending hashes, so that only the pending entries are handled one by one in Python
+        # (the pending hashes are never in the arrays, see add())
+        hashes = array("Q")
+        times = array("I")
+        start = 0
+        for h, t in sorted(self._pending.items()):
+            i = bisect_left(self._hashes, h, start)
+            hashes.extend(self._hashes[start:i])
+            times.extend(self._times[start:i])
+            hashes.append(h)
+            times.append(t)
+            start = i
+        hashes.extend(self._hashes[start:])
+        times.extend(self._times[start:])
+
+        new_times = sorted(self._pending.values())
+        if not self._sorted_times or new_times[0] >= self._sorted_times[-1]:
+            # The usual case: the new entries are the most recent ones
+            self._sorted_times.extend(new_times)
+        else:
+            self._sorted_times = array("I", sorted(chain(self._sorted_times, new_times)))
+
+        self._hashes = hashes
+        self._times = times
+        self._pending = {}
+        self._expired = bisect_right(self._sorted_times, self._cutoff)
+
+    def contains_hash(self, h):
+        if self._bloom is not None and h not in self._bloom:
+            return False
+        t = self._pending.get(h)
+        if t is None:
+            i = self._find(h)
+            if i < 0:
+                return False
+            t = self._times[i]
+        return t > self._cutoff
+
+    def __contains__(self, link):
+        return self.contains_hash(hash_permalink(link))
+
+    def published_time(self, link):
+        """
+        Published time (epoch seconds) of `link`, or None if it is not in the index
+        """
+        h = hash_permalink(link)
+        t = self._pending.get(h)
+        if t is None:
+            i = self._find(h)
+            if i < 0:
+                return None
+            t = self._times[i]
+        return t if t > self._cutoff else None
+
+    def add(self, link, published_time):
+        """
+        Add `link` with its published time in epoch seconds
+        """
+        h = hash_permalink(link)
+        i = self._find(h)
+        if i >= 0:
+            # Update the entry of the arrays in place
+            old = self._times[i]
+            self._times[i] = published_time
+            del self._sorted_times[bisect_left(self._sorted_times, old)]
+            self._sorted_times.insert(bisect_right(self._sorted_times, published_time), published_time)
+            self._expired = bisect_right(self._sorted_times, self._cutoff)
+            return
+
+        self._pending[h] = published_time
+        if self._bloom is not None:
+            self._bloom.add(h)
+
+        if len(self._pending) > max(1024, len(self._hashes) // 4):
+            self._merge()
+        if self._bloom is not None and len(self._hashes) + len(self._pending) > self._bloom.capacity:
+            self._rebuild_bloom()
+
+    def remove_older_than(self, cutoff):
+        """
+        Remove the entries published at or before `cutoff` (epoch seconds).
+        Returns the number of removed entries.
+        """
+        if cutoff <= self._cutoff:
+            return 0
+
+        removed = 0
+        for h, t in list(self._pending.items()):
+            if t <= cutoff:
+                del self._pending[h]
+                # The ones at or before the previous cutoff were already expired
+                removed += t > self._cutoff
+
+        self._cutoff = cutoff
+        expired = bisect_right(self._sorted_times, cutoff)
+        removed += expired - self._expired
+        self._expired = expired
+
+        if self._expired > len(self._hashes) // 4:
+            self._compact()
+
+        return removed
+
+    def _compact(self):
+        """
+        Drop the expired entries from the arrays
+        """
+        cutoff = self._cutoff
+        keep = [t > cutoff for t in self._times]
+        self._hashes = array("Q", compress(self._hashes, keep))
+        self._times = array("I", compress(self._times, keep))
+        self._sorted_times = self._sorted_times[self._expired:]
+        self._expired = 0
+        self._rebuild_bloom()
+
+    def memory_usage(self):
+        """
+        Approximate size in bytes of the arrays and the Bloom filter
+        """
+        size = sum(a.itemsize * len(a) for a in (self._hashes, self._times, self._sorted_times))
+        if self._bloom is not None:
+            size += len(self._bloom.bits)
+        return size
@@ -0,0 +1,169 @@
+"""
+Ledger of the delete requests of bot_del_req.py, persisted across runs.
+
+Every "@partybot deleteThis!" is recorded once as a vote keyed by (post id, requesting user),
+with the time of the request, in a SQLite database. The ledger also keeps the highest id
+already handled of every listing the requests are read from (the comments of the community,
+the mentions and the replies of the bot), so a run only reads what was posted since the
+previous one, and it marks the posts that reached the threshold (and were deleted), so their
+later requests are ignored. The names of the requesting users are cached in it as well (see
+bot_del_req.resolve_user_names).
+
+The number of votes of a post is a COUNT over the primary key, so it does not depend on how
+many comments the post has, and the old votes are dropped with remove_older_than().
+"""
+import sqlite3
+import time
+
+
+class DeleteVoteLedger:
+    def __init__(self, path="del_req_state.db", timeout=30):
+        """
+        path: Path to the SQLite database (created if it does not exist)
+        timeout: How long (in seconds) to wait for another process holding the write lock
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.is_new = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'votes'"
+        ).fetchone() is None
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS votes ("
+            "post_id INTEGER NOT NULL, "
+            "creator_id INTEGER NOT NULL, "
+            "comment_id INTEGER NOT NULL, "
+            "requested_at INTEGER NOT NULL, "
+            "PRIMARY KEY (post_id, creator_id)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS votes_requested_at ON votes (requested_at)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS closed_posts ("
+            "post_id INTEGER PRIMARY KEY, "
+            "closed_at INTEGER NOT NULL"
+            ")"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "fetched_at INTEGER NOT NULL, "
+            "used_at INTEGER NOT NULL"
+            ")"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS users_used_at ON users (used_at)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def high_water(self, key):
+        """
+        Highest id already handled of the listing `key` (0 if none)
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def set_high_water(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (key, value),
+        )
+
+    def max_comment_id(self):
+        """
+        Highest comment id of the community already handled (0 if none)
+        """
+        return self.high_water("max_comment_id")
+
+    def add_vote(self, post_id, creator_id, comment_id, requested_at):
+        """
+        Record the request of `creator_id` to delete `post_id` (`requested_at` in epoch seconds).
+        Returns False if the user had already asked for it.
+        """
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO votes (post_id, creator_id, comment_id, requested_at) VALUES (?, ?, ?, ?)",
+            (post_id, creator_id, comment_id, requested_at),
+        )
+        return cursor.rowcount == 1
+
+    def vote_count(self, post_id):
+        return self.conn.execute("SELECT COUNT(*) FROM votes WHERE post_id = ?", (post_id,)).fetchone()[0]
+
+    def posts_to_delete(self, threshold):
+        """
+        Ids of the posts with at least `threshold` votes that are not closed yet
+        """
+        rows = self.conn.execute(
+            "SELECT post_id FROM votes WHERE post_id NOT IN (SELECT post_id FROM closed_posts) "
+            "GROUP BY post_id HAVING COUNT(*) >= ?",
+            (threshold,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_closed(self, post_id):
+        return self.conn.execute("SELECT 1 FROM closed_posts WHERE post_id = ?", (post_id,)).fetchone() is not None
+
+    def close_post(self, post_id):
+        """
+        Mark `post_id` as having reached the threshold
+        """
+        self.conn.execute(
+            "INSERT OR IGNORE INTO closed_posts (post_id, closed_at) VALUES (?, ?)",
+            (post_id, int(time.time())),
+        )
+
+    def user_names(self, user_ids, ttl_seconds):
+        """
+        Return a dict of user id -> cached name for the `user_ids` fetched less than `ttl_seconds` ago
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        placeholders = ", ".join("?" * len(user_ids))
+        rows = self.conn.execute(
+            f"SELECT user_id, name FROM users WHERE user_id IN ({placeholders}) AND fetched_at > ?",
+            (*user_ids, int(time.time()) - ttl_seconds),
+        ).fetchall()
+        return dict(rows)
+
+    def save_user_names(self, names, fetched=(), max_users=1000):
+        """
+        Mark the users of `names` (user id -> name) as used, refreshing the fetch time of the
+        `fetched` ones, and keep only the `max_users` most recently used
+        """
+        now = int(time.time())
+        fetched = set(fetched)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for user_id, name in names.items():
+                self.conn.execute(
+                    "INSERT INTO users (user_id, name, fetched_at, used_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET name = excluded.name, used_at = excluded.used_at"
+                    + (", fetched_at = excluded.fetched_at" if user_id in fetched else ""),
+                    (user_id, name, now if user_id in fetched else 0, now),
+                )
+            self.conn.execute(
+                "DELETE FROM users WHERE user_id NOT IN (SELECT user_id FROM users ORDER BY used_at DESC LIMIT ?)",
+                (max_users,),
+            )
+
+    def remove_older_than(self, days):
+        """
+        Remove the votes and closed posts older than `days` days. Returns the number of removed votes.
+        """
+        cutoff = int(time.time()) - 86400 * days
+        cursor = self.conn.execute("DELETE FROM votes WHERE requested_at <= ?", (cutoff,))
+        self.conn.execute("DELETE FROM closed_posts WHERE closed_at <= ?", (cutoff,))
+        return cursor.rowcount
+
+    def close(self):
+        # Fold the WAL back into the database file, so it can be uploaded as a single file
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
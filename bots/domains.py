@@ -0,0 +1,102 @@
+"""
+Domain helpers shared by every bot.
+
+The ignore list (ignored.txt) is compiled into a DomainMatcher, a trie over the reversed labels
+of the listed domains, which matches a url against every entry in a single pass over its host:
+
+    example.com        example.com and all its subdomains
+    sub.example.com    sub.example.com and all its subdomains (but not example.com)
+    *.example.com      the subdomains of example.com only
+
+load_domain_matcher() keeps the compiled matcher in memory and only rebuilds it when the
+modification time of ignored.txt changes.
+"""
+import os
+from urllib.parse import urlsplit
+
+
+def load_ignored_domains(path="ignored.txt", as_set=True):
+    with open(path) as f:
+        lines = [l.strip() for l in f.readlines()]
+    lines = [l for l in lines if not l.startswith("#") and l != ""]
+    if as_set is True:
+        lines = set(lines)
+
+    return lines
+
+
+# Markers stored in the trie nodes, next to the child labels
+_MATCH_DOMAIN = "$"
+_MATCH_SUBDOMAINS = "*"
+
+class DomainMatcher:
+    def __init__(self, patterns=()):
+        """
+        patterns: Domains (example.com, sub.example.com) or wildcards (*.example.com) to match
+        """
+        self._root = {}
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        pattern = pattern.strip().lower().rstrip(".")
+        marker = _MATCH_DOMAIN
+        if pattern.startswith("*."):
+            pattern = pattern[2:]
+            marker = _MATCH_SUBDOMAINS
+
+        node = self._root
+        for label in reversed(pattern.split(".")):
+            node = node.setdefault(label, {})
+        # Keep the original pattern, to report which entry matched
+        node.setdefault(marker, pattern if marker == _MATCH_DOMAIN else f"*.{pattern}")
+
+    def match_host(self, host):
+        """
+        Return the pattern matching `host`, or None
+        """
+        labels = host.lower().rstrip(".").split(".")
+        node = self._root
+        for i in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[i])
+            if node is None:
+                return None
+            if _MATCH_DOMAIN in node:
+                return node[_MATCH_DOMAIN]
+            if i > 0 and _MATCH_SUBDOMAINS in node:
+                return node[_MATCH_SUBDOMAINS]
+
+        return None
+
+    def match(self, url):
+        """
+        Return the pattern matching the host of `url`, or None (also for a missing url or a
+        url without a host, like the relative link of a crosspost)
+        """
+        if not url:
+            return None
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return None
+        if not host:
+            return None
+
+        return self.match_host(host)
+
+
+_matchers = {}
+
+def load_domain_matcher(path="ignored.txt"):
+    """
+    Compile the domains of `path` into a DomainMatcher, reusing the one compiled before as long
+    as the file has not been modified
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _matchers.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    matcher = DomainMatcher(load_ignored_domains(path, as_set=False))
+    _matchers[path] = (mtime, matcher)
+    return matcher
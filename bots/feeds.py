@@ -0,0 +1,132 @@
+"""
+Concurrent fetching of the subreddit feeds.
+
+All feeds are downloaded with a bounded thread pool sharing a single pooled requests.Session,
+with a limit on the number of simultaneous requests to the same host (every feed lives on
+www.reddit.com) and a timeout per request. Each feed is parsed by feedparser in the worker
+thread that downloaded it, so the total time for N feeds is close to the slowest single feed.
+
+The ETag and Last-Modified headers of every feed are remembered in `cache` and sent back on
+the next fetch. When reddit answers 304 Not Modified the feed is not parsed at all, and an
+empty feed with `status` 304 is returned, like feedparser.parse() does for its own etag support.
+
+The entries of a parsed feed are replaced by FeedEntry records right after parsing. A
+FeedParserDict entry holds every element of the entry with its *_detail variant and resolves
+every attribute access through its key mapping, while the bots only read the title, link,
+published time and summary: a FeedEntry is a namedtuple of just those four, with the published
+time parsed once into epoch seconds.
+"""
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import feedparser
+import requests
+from requests.adapters import HTTPAdapter
+
+from state import to_epoch
+
+
+USER_AGENT = "reddit-repost-bot (+https://github.com/JCSpark1/reddit-repost-bot)"
+
+
+# published: epoch seconds
+FeedEntry = namedtuple("FeedEntry", ("title", "link", "published", "summary"))
+
+def compact_entries(parsed_feed):
+    """
+    Replace the entries of a parsed feed by FeedEntry records (in place). Returns the feed.
+    """
+    parsed_feed["entries"] = [
+        FeedEntry(entry.title, entry.link, to_epoch(entry.published), entry.get("summary", ""))
+        for entry in parsed_feed.entries
+    ]
+    return parsed_feed
+
+
+class FeedFetcher:
+    def __init__(self, max_workers=16, per_host=8, timeout=15, cache=None):
+        """
+        max_workers: Maximum number of feeds fetched at the same time
+        per_host: Maximum number of simultaneous requests to the same host
+        timeout: Timeout (in seconds) of a single feed request
+        cache: Dict of url -> {"etag": ..., "last_modified": ...} from a previous run (updated in place)
+        """
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache = {} if cache is None else cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+
+        self._host_lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+
+    def _slot(self, url):
+        with self._host_lock:
+            return self._host_slots[urlparse(url).netloc]
+
+    def fetch(self, url):
+        """
+        Download and parse a single feed. Returns None if the feed could not be downloaded.
+        """
+        if urlparse(url).scheme not in ("http", "https"):
+            # Local files (handy for testing) are read by feedparser directly
+            return compact_entries(feedparser.parse(url))
+
+        headers = {}
+        validators = self.cache.get(url, {})
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        try:
+            with self._slot(url):
+                res = self.session.get(url, headers=headers, timeout=self.timeout)
+            res.raise_for_status()
+        except requests.RequestException as err:
+            print(f"Failed to fetch {url}: {err}")
+            return None
+
+        if res.status_code == 304:
+            return feedparser.FeedParserDict(status=304, entries=[], bozo=False, href=url)
+
+        validators = {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+        }
+        if any(validators.values()):
+            self.cache[url] = validators
+        else:
+            self.cache.pop(url, None)
+
+        headers = dict(res.headers)
+        headers["content-location"] = res.url
+        return compact_entries(feedparser.parse(res.content, response_headers=headers))
+
+    def invalidate(self, url):
+        """
+        Forget the validators of `url`, so that the next fetch downloads and parses it again
+        """
+        self.cache.pop(url, None)
+
+    def fetch_all(self, urls):
+        """
+        Download and parse all `urls` concurrently. Returns a dict of url -> parsed feed (or None).
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            parsed = executor.map(self.fetch, urls)
+            return dict(zip(urls, parsed))
+
+    def close(self):
+        self.session.close()
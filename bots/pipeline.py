@@ -0,0 +1,128 @@
+"""
+Streaming pipeline over the entries of a feed.
+
+The entries of a parsed feed flow one at a time through a chain of generators:
+
+    entries -> titles -> age -> already published -> format -> ignored domain -> cap -> publish
+
+Each stage pulls the next entry from the previous one only when it is asked for one, so no
+stage builds a list of entries, an entry is formatted (its summary scanned for links) once and
+only if it passed the cheaper filters, and publishing stops pulling as soon as `max_posts`
+entries were posted: the entries after that are never looked at. The ignored domains are
+filtered before the cap, so an entry linking to an ignored domain no longer takes the place of
+a post that could have been published.
+
+Every stage counts the entries it drops in a StageCounters, which the caller prints once per
+feed. The stages only depend on their arguments, so any bot can chain them differently.
+"""
+import html
+from collections import Counter
+from itertools import islice
+from urllib.parse import urlparse
+
+from publisher import RateLimitExceeded
+from summary import format_and_extract
+
+
+class StageCounters(Counter):
+    """
+    Number of entries seen and dropped by every stage, in the order they were first counted
+    """
+    def __str__(self):
+        return ", ".join(f"{stage}: {count}" for stage, count in self.items())
+
+
+def _path(entry):
+    return urlparse(entry.link).path
+
+def read_entries(parsed_feed, counters):
+    """
+    The entries of a parsed feed (FeedEntry records, see feeds.py)
+    """
+    for entry in parsed_feed.entries:
+        counters["entries"] += 1
+        yield entry
+
+def filter_titles(entries, title_filter, counters):
+    """
+    Drop the entries whose title matches the title rules (see title_filters.py)
+    """
+    for entry in entries:
+        reject_reason = title_filter.reject_reason(entry.title)
+        if reject_reason is not None:
+            counters["title"] += 1
+            print(f"Skip Reddit post as its title matched {reject_reason}: {entry.title} ({_path(entry)})")
+            continue
+        yield entry
+
+def filter_age(entries, cutoff, limit_hours, counters):
+    """
+    Drop the entries published before `cutoff` (epoch seconds, `limit_hours` hours ago)
+    """
+    for entry in entries:
+        if entry.published < cutoff:
+            counters["too old"] += 1
+            print(f"Skip entry published >{limit_hours}h ago: {_path(entry)}")
+            continue
+        yield entry
+
+def filter_published(entries, published_urls, counters):
+    """
+    Drop the entries already in `published_urls`
+    """
+    for entry in entries:
+        if entry.link in published_urls:
+            counters["already published"] += 1
+            print(f"Skip entry already published:  {_path(entry)}")
+            continue
+        yield entry
+
+def format_entries(entries):
+    """
+    Yield (entry, markdown body, shared link) for every entry (see summary.py)
+    """
+    for entry in entries:
+        formatted, extracted_url = format_and_extract(entry.summary)
+        yield entry, formatted, extracted_url
+
+def filter_domains(posts, ignored_domains, counters):
+    """
+    Drop the formatted entries whose shared link matches the ignore list (see domains.py)
+    """
+    for entry, formatted, extracted_url in posts:
+        ignored_domain = ignored_domains.match(extracted_url)
+        if ignored_domain is not None:
+            counters["ignored domain"] += 1
+            print(f"Ignore post with link matched to '{ignored_domain}' in ignore list: {_path(entry)}")
+            continue
+        yield entry, formatted, extracted_url
+
+def publish(posts, publisher, community_id, published_urls, max_posts, counters):
+    """
+    Publish at most `max_posts` of the formatted entries to the community, recording every
+    published one in `published_urls` right away. An entry the instance refused is left for
+    the next run, while an entry it may have created without a readable answer is recorded as
+    well, so it is never posted twice. Returns True if the feed may still hold entries to
+    publish (the cap was reached, a post failed, or the instance kept rate limiting).
+    """
+    for entry, formatted, extracted_url in islice(posts, max_posts):
+        print(f"Publishing post: {_path(entry)}")
+        try:
+            post = publisher.create_post(
+                community_id=community_id,
+                name=html.unescape(entry.title),
+                url=extracted_url,
+                body=formatted,
+            )
+        except RateLimitExceeded as err:
+            print(f"{err}, leaving the remaining entries for the next run")
+            return True
+
+        if post is None:
+            counters["failed"] += 1
+            continue
+
+        counters["posted" if post else "unconfirmed"] += 1
+        published_urls.add(entry.link, entry.published)
+
+    return counters["posted"] + counters["unconfirmed"] + counters["failed"] >= max_posts
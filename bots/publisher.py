@@ -0,0 +1,231 @@
+"""
+Rate-limited publishing of the posts to lemmy.
+
+Instead of sleeping a fixed `sleep_time` after every post, the posts go through a token bucket
+sized from the instance's own post rate limit (`local_site_rate_limit` of GET /site, e.g. 6
+posts per 600 seconds), so a burst of posts goes out at once and the following ones are spaced
+just enough to stay under the limit. The posts are sent with a pooled requests.Session rather
+than through pythorhead, which hides the status code and headers of the responses: when the
+instance still answers 429 (or its "rate_limit_error"), the bucket is emptied and the post is
+retried after the Retry-After delay. When it rejects the JWT, the session logs in again and
+the post is retried once (see session.py). A post whose request went out but got no readable
+answer is never retried, as the instance may have created it already.
+"""
+import email.utils
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from feeds import USER_AGENT
+
+
+# Default post rate limit of lemmy, used if the instance does not report its own
+DEFAULT_POSTS = 6
+DEFAULT_PER_SECONDS = 600
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_seconds, clock=time.monotonic, sleep=time.sleep):
+        """
+        capacity: Number of tokens of a full bucket (the size of a burst)
+        per_seconds: Time (in seconds) to refill a full bucket
+        clock: Function returning the current time in seconds
+        sleep: Function sleeping for a number of seconds
+        """
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take a token, waiting for one to be available. Returns the time waited in seconds.
+        """
+        waited = 0
+        while True:
+            self._refill()
+            wait = max(self.blocked_until - self.updated, 0)
+            if not wait and self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            if not wait:
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """
+        Empty the bucket and hand out no token for the next `seconds` seconds
+        """
+        self._refill()
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, self.updated + seconds)
+
+
+def parse_retry_after(value, default=60):
+    """
+    Delay in seconds of a Retry-After header (a number of seconds or an HTTP date)
+    """
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def _is_auth_error(res):
+    try:
+        return res.json().get("error") in ("not_logged_in", "incorrect_login")
+    except ValueError:
+        return False
+
+
+def _was_sent(err):
+    """
+    Whether the request failing with `err` may have reached the server (the connection was
+    established before it failed)
+    """
+    if isinstance(err, requests.ConnectTimeout):
+        return False
+    reason = getattr(err.args[0], "reason", None) if err.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+class Publisher:
+    def __init__(self, session, rate_limit=None, max_retries=3, timeout=15):
+        """
+        session: LemmySession (the JWT and API url of its pythorhead Lemmy instance are reused)
+        rate_limit: {"posts": ..., "per_seconds": ...}, to use instead of the instance's post rate limit
+        max_retries: Number of times a rate limited post is retried
+        timeout: Timeout (in seconds) of a single request
+        """
+        self.session = session
+        self.lemmy = session.lemmy
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.http = requests.Session()
+        self.http.headers["User-Agent"] = USER_AGENT
+
+        if rate_limit is None:
+            rate_limit = self.fetch_rate_limit()
+        print(f"Post rate limit: {rate_limit['posts']} posts per {rate_limit['per_seconds']} seconds")
+        self.bucket = TokenBucket(rate_limit["posts"], rate_limit["per_seconds"])
+
+    @property
+    def api_url(self):
+        return self.lemmy._requestor._auth.api_url
+
+    def _auth(self, payload):
+        """
+        Headers authenticating a request with the JWT of the Lemmy session (in the payload
+        itself before lemmy 0.19)
+        """
+        requestor = self.lemmy._requestor
+        token = requestor._auth.token
+        if not token:
+            return {}
+        if requestor.nodeinfo and requestor.get_instance_version().compare("0.19.0") < 0:
+            payload["auth"] = token
+            return {}
+        return {"Authorization": f"Bearer {token}"}
+
+    def fetch_rate_limit(self):
+        """
+        Post rate limit of the instance, as reported by GET /site
+        """
+        params = {}
+        headers = self._auth(params)
+        try:
+            res = self.http.get(f"{self.api_url}/site", params=params, headers=headers, timeout=self.timeout)
+            res.raise_for_status()
+            limits = res.json()["site_view"]["local_site_rate_limit"]
+            return {"posts": limits["post"], "per_seconds": limits["post_per_second"]}
+        except (requests.RequestException, ValueError, KeyError) as err:
+            print(f"Could not read the post rate limit of the instance: {err!r}")
+            return {"posts": DEFAULT_POSTS, "per_seconds": DEFAULT_PER_SECONDS}
+
+    def create_post(self, community_id, name, url=None, body=None):
+        """
+        Create a post once the rate limit allows it. Returns the post data, {} if the post may
+        have been created but its response could not be read (a timeout or a dropped connection
+        after the request was sent, or a body that is not JSON), or None if the instance refused
+        the post or could not be reached. Raises RateLimitExceeded if the post is still rate
+        limited after `max_retries` retries.
+        """
+        payload = {"community_id": community_id, "name": name}
+        if url is not None:
+            payload["url"] = url
+        if body is not None:
+            payload["body"] = body
+
+        relogged = False
+        attempts = 0
+        while attempts <= self.max_retries:
+            attempts += 1
+            waited = self.bucket.acquire()
+            if waited:
+                print(f"Waited {waited:.1f}s for the post rate limit")
+
+            headers = self._auth(payload)
+            try:
+                res = self.http.post(f"{self.api_url}/post", json=payload, headers=headers, timeout=self.timeout)
+            except requests.RequestException as err:
+                if not _was_sent(err):
+                    print(f"Failed to create post: {err}")
+                    return None
+                # The instance can be slow to create a link post: retrying could post the entry twice
+                print(f"No response to the post, it may have been created: {err}")
+                return {}
+
+            if res.status_code == 429 or (not res.ok and "rate_limit_error" in res.text):
+                delay = parse_retry_after(res.headers.get("Retry-After"))
+                print(f"Rate limited by the instance, retrying in {delay:.0f}s")
+                self.bucket.pause(delay)
+                continue
+
+            if not relogged and (res.status_code == 401 or (not res.ok and _is_auth_error(res))):
+                # The saved JWT expired or was revoked: log in again and retry once
+                relogged = True
+                attempts -= 1
+                payload.pop("auth", None)
+                if self.session.log_in():
+                    continue
+                return None
+
+            if not res.ok:
+                print(f"Failed to create post: {res.status_code} {res.text}")
+                if "couldnt_find_community" in res.text:
+                    self.session.forget_community(community_id)
+                return None
+
+            try:
+                return res.json()
+            except ValueError:
+                print(f"Created post, but could not read the response: {res.status_code}")
+                return {}
+
+        raise RateLimitExceeded(f"Still rate limited after {self.max_retries} retries")
+
+    def close(self):
+        self.http.close()
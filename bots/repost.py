@@ -0,0 +1,401 @@
+"""
+Shared logic for the reddit -> lemmy repost bots.
+
+Every feed that is mirrored is described by one entry in `bots.json` (at the root of the
+repo). `main()` opens a single Lemmy session (reused across runs, see session.py), loads the
+ignore list once, fetches every requested feed concurrently (see feeds.py) and then processes
+them in the same process, so running ten bots no longer costs ten interpreter startups, ten
+logins and ten cold imports. Each feed keeps its
+own state (published URLs, feed cache, last published date) in `state_dir/<name>/` (see
+state.py), so bots running in parallel never overwrite each other's files.
+
+`run_daemon()` keeps the same process running instead: the feeds are polled on their own
+schedule (see scheduler.py) with the Lemmy session, the connection pool and the state kept
+warm between polls, and the state of a feed is checkpointed to disk after each of its polls.
+"""
+import os
+import datetime as dt
+import signal
+import threading
+import time
+import json
+
+from domains import load_domain_matcher
+from feeds import FeedFetcher
+from pipeline import (
+    StageCounters,
+    filter_age,
+    filter_domains,
+    filter_published,
+    filter_titles,
+    format_entries,
+    publish,
+    read_entries,
+)
+from publisher import Publisher
+from scheduler import FeedScheduler
+from session import LemmySession
+from title_filters import compile_title_filter, merge_title_rules
+from state import FeedState, to_epoch
+from state_backends import open_state_backend
+
+
+def get_last_published_time(
+    path="last_date_published.txt", offset=dt.timedelta(minutes=10, seconds=45)
+):
+    try:
+        with open(path, "r") as f:
+            last_published_str = f.read().strip()
+            last_published = dt.datetime.fromisoformat(last_published_str)
+    except FileNotFoundError:
+        # If last_date_published.txt does not exist, set an initial last_published
+        dt_now = dt.datetime.now(dt.timezone.utc)
+        last_published = dt_now - offset
+    return last_published
+
+def load_published_urls_dict(path="published_urls.json"):
+    try:
+        with open(path, "r") as f:
+            published_urls_dict = json.load(f)
+    except FileNotFoundError:
+        published_urls_dict = {}
+
+    return published_urls_dict
+
+def load_feed_cache(path="feed_cache.json"):
+    try:
+        with open(path, "r") as f:
+            feed_cache = json.load(f)
+    except FileNotFoundError:
+        feed_cache = {}
+
+    return feed_cache
+
+def save_feed_cache(feed_cache, path="feed_cache.json"):
+    with open(path, "w") as f:
+        json.dump(feed_cache, f, indent=2)
+
+def load_schedule(path="schedule.json"):
+    try:
+        with open(path, "r") as f:
+            schedule = json.load(f)
+    except FileNotFoundError:
+        schedule = {}
+
+    return schedule
+
+def save_schedule(schedule, path="schedule.json"):
+    with open(path, "w") as f:
+        json.dump(schedule, f, indent=2)
+
+def write_last_published_time(dt_now, path="last_date_published.txt"):
+    with open(path, "w") as f:
+        f.write(dt_now.isoformat())
+
+
+def load_config(path="bots.json"):
+    """
+    Load the bot configuration. The file holds the global settings (instance_url,
+    limit_hours, max_posts_per_run, post_rate_limit, session_ttl_hours, community_ttl_hours,
+    fetch_workers, fetch_per_host, fetch_timeout, the poll_* settings of the daemon mode (see
+    scheduler.py), state_dir, state_file, state_bloom, state_backend, state_mirror_dir,
+    title_rules) and a list of `feeds`, each with a `name`, the lemmy `community`, the
+    `subreddit_rss_url`, optional `title_rules` (see title_filters.py), which are added to the
+    global ones, an optional `max_posts_per_run` and an optional fixed `poll_interval_minutes`
+    for the daemon mode.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+
+    config.setdefault("instance_url", "https://lemmy.ca")
+    config.setdefault("limit_hours", 24)
+    config.setdefault("max_posts_per_run", 3)
+    config.setdefault("post_rate_limit", None)
+    config.setdefault("session_ttl_hours", 24 * 7)
+    config.setdefault("community_ttl_hours", 24)
+    config.setdefault("fetch_workers", 16)
+    config.setdefault("fetch_per_host", 8)
+    config.setdefault("fetch_timeout", 15)
+    config.setdefault("poll_interval_minutes", 30)
+    config.setdefault("poll_jitter_seconds", 60)
+    config.setdefault("poll_min_minutes", 5)
+    config.setdefault("poll_max_minutes", 360)
+    config.setdefault("poll_budget_per_hour", 120)
+    config.setdefault("poll_half_life_hours", 24)
+    config.setdefault("state_dir", "state")
+    config.setdefault("state_file", "published_urls.db")
+    config.setdefault("state_bloom", False)
+    config.setdefault("state_backend", "local")
+    config.setdefault("state_mirror_dir", "state_mirror")
+    config.setdefault("title_rules", {})
+    config.setdefault("feeds", [])
+
+    return config
+
+def select_feeds(config, names=None):
+    """
+    Return the feeds of `config` whose name is in `names` (all of them if `names` is None)
+    """
+    if names is None:
+        return config["feeds"]
+
+    feeds = [feed for feed in config["feeds"] if feed["name"] in names]
+    missing = set(names) - {feed["name"] for feed in feeds}
+    if missing:
+        raise ValueError(f"Unknown feed(s) in bots.json: {', '.join(sorted(missing))}")
+
+    return feeds
+
+def run_feed(
+    community_id, publisher, feed, parsed_feed, published_urls, ignored_domains, dt_now,
+    limit_hours=24, max_posts=3, title_rules=None
+):
+    """
+    Publish the new entries of an already fetched subreddit feed to the feed's community
+    (`community_id`, None if it could not be found), through the rate limited `publisher` (see
+    publisher.py). The entries are streamed through the stages of pipeline.py, and every
+    published entry is recorded in `published_urls` (see state.py) right away.
+
+    Returns True if the feed may still hold entries to publish on the next run (because at
+    most `max_posts` entries are published per run, or the instance kept rate limiting).
+    """
+    community_name = feed["community"]
+    subreddit_rss_url = feed["subreddit_rss_url"]
+    title_filter = compile_title_filter(merge_title_rules(title_rules, feed.get("title_rules")))
+
+    print(f"\n== {subreddit_rss_url} -> {community_name}")
+
+    if community_id is None:
+        print(f"Could not find community '{community_name}', skipping feed")
+        return True
+
+    if parsed_feed is None:
+        print("Feed could not be fetched, skipping feed")
+        return True
+
+    if parsed_feed.get("status") == 304:
+        print("Feed not modified since the last run, skipping feed")
+        return False
+
+    counters = StageCounters()
+    entries = read_entries(parsed_feed, counters)
+    entries = filter_titles(entries, title_filter, counters)
+    entries = filter_age(entries, to_epoch(dt_now - dt.timedelta(hours=limit_hours)), limit_hours, counters)
+    entries = filter_published(entries, published_urls, counters)
+    posts = filter_domains(format_entries(entries), ignored_domains, counters)
+    pending = publish(posts, publisher, community_id, published_urls, max_posts, counters)
+
+    print(f"Entries of the feed, {counters}")
+    return pending
+
+def open_feed_state(config, feed):
+    """
+    Open the state partition of `feed` (see state.FeedState). A new partition is seeded with
+    the published URLs of the old shared published_urls.json, so that moving to per-feed state
+    does not repost anything.
+    """
+    feed_state = FeedState(
+        config["state_dir"], feed["name"], store_file=config["state_file"], use_bloom=config["state_bloom"]
+    )
+
+    if feed_state.is_new:
+        # The shared file may still be needed by the other feeds, so it is not removed
+        imported = feed_state.published_urls.import_dict(load_published_urls_dict())
+        if imported:
+            print(f"[{feed['name']}] Imported {imported} URLs from the shared state")
+
+    return feed_state
+
+class Reposter:
+    def __init__(self, config, feeds):
+        """
+        Open the Lemmy session (see session.py) and the state partition of every feed of
+        `feeds`. The Lemmy session, the pooled connections of the feed fetcher and the state of
+        the feeds are kept between runs, so the daemon mode pays for them only once.
+        """
+        self.config = config
+        self.feeds = {feed["name"]: feed for feed in feeds}
+
+        username = os.environ["LEMMY_USERNAME"]
+        password = os.environ["LEMMY_PASSWORD"]
+
+        self.session = LemmySession(
+            config["instance_url"],
+            username,
+            password,
+            session_path=os.path.join(config["state_dir"], "session.json"),
+            communities_path=os.path.join(config["state_dir"], "communities.json"),
+            ttl_hours=config["session_ttl_hours"],
+            community_ttl_hours=config["community_ttl_hours"],
+        )
+        self.publisher = Publisher(self.session, rate_limit=config["post_rate_limit"])
+
+        self.fetcher = FeedFetcher(
+            max_workers=config["fetch_workers"],
+            per_host=config["fetch_per_host"],
+            timeout=config["fetch_timeout"],
+        )
+
+        self.backend = open_state_backend(config["state_backend"], config["state_dir"], config["state_mirror_dir"])
+        self.feed_states = {}
+        try:
+            for feed in feeds:
+                self.backend.restore(feed["name"])
+                feed_state = open_feed_state(config, feed)
+                self.feed_states[feed["name"]] = feed_state
+
+                # Read the last published date from the feed's last_date_published.txt
+                last_published = get_last_published_time(feed_state.last_published_path)
+                print(f"[{feed['name']}] Fetched last published date:", last_published)
+
+                self.fetcher.cache.update(load_feed_cache(feed_state.feed_cache_path))
+        except Exception:
+            self.close()
+            raise
+
+    def run(self, names=None):
+        """
+        Fetch the feeds named in `names` (default: all of them) concurrently and publish their
+        new entries. Returns the names of the feeds that may still hold entries to publish, and
+        a dict of name -> published times (epoch seconds) of the fetched entries (None if the
+        feed could not be fetched).
+        """
+        feeds = [self.feeds[name] for name in (self.feeds if names is None else names)]
+        limit_hours = self.config["limit_hours"]
+        dt_now = dt.datetime.now(dt.timezone.utc)
+
+        # The ignore list is only read again when ignored.txt changes
+        ignored_domains = load_domain_matcher()
+
+        for feed in feeds:
+            published_urls = self.feed_states[feed["name"]].published_urls
+            published_urls.remove_older_than(limit_hours=limit_hours)
+            print(f"[{feed['name']}] Found {len(published_urls)} URLs from reddit that was published to lemmy in the last {limit_hours} hours")
+
+        parsed_feeds = self.fetcher.fetch_all(feed["subreddit_rss_url"] for feed in feeds)
+        community_ids = self.session.community_ids(feed["community"] for feed in feeds)
+
+        pending_feeds = []
+        published_times = {}
+        for feed in feeds:
+            url = feed["subreddit_rss_url"]
+            parsed_feed = parsed_feeds[url]
+            published_times[feed["name"]] = None if parsed_feed is None else [
+                entry.published for entry in parsed_feed.entries
+            ]
+            pending = run_feed(
+                community_ids[feed["community"]],
+                self.publisher,
+                feed,
+                parsed_feed,
+                self.feed_states[feed["name"]].published_urls,
+                ignored_domains,
+                dt_now,
+                limit_hours=limit_hours,
+                max_posts=feed.get("max_posts_per_run", self.config["max_posts_per_run"]),
+                title_rules=self.config["title_rules"],
+            )
+            # Only skip the feed on the next run if nothing is left to publish from it
+            if pending:
+                self.fetcher.invalidate(url)
+                pending_feeds.append(feed["name"])
+            self.checkpoint(feed["name"], dt_now)
+
+        return pending_feeds, published_times
+
+    def checkpoint(self, name, dt_now):
+        """
+        Write the state of the feed `name` to its partition on disk
+        """
+        feed_state = self.feed_states[name]
+        url = self.feeds[name]["subreddit_rss_url"]
+
+        write_last_published_time(dt_now, feed_state.last_published_path)
+        # Each partition only keeps the validators of its own feed
+        save_feed_cache({url: self.fetcher.cache[url]} if url in self.fetcher.cache else {}, feed_state.feed_cache_path)
+        feed_state.published_urls.checkpoint()
+
+    def close(self):
+        self.fetcher.close()
+        self.publisher.close()
+        self.session.close()
+        for name, feed_state in self.feed_states.items():
+            feed_state.close()
+            self.backend.persist(name)
+        self.backend.finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(feed_names=None, config_path="bots.json"):
+    """
+    Run every feed of `config_path` (or only the ones named in `feed_names`) once, with a
+    single Lemmy session. Each feed reads and writes only its own state partition.
+    """
+    config = load_config(config_path)
+    feeds = select_feeds(config, feed_names)
+
+    with Reposter(config, feeds) as reposter:
+        reposter.run()
+
+def run_daemon(feed_names=None, config_path="bots.json"):
+    """
+    Keep running every feed of `config_path` (or only the ones named in `feed_names`) until
+    SIGINT or SIGTERM, each one at the interval picked by the scheduler from its posting rate
+    (see scheduler.py). A feed that may still hold entries to publish is polled again after
+    `poll_min_minutes` instead.
+    """
+    config = load_config(config_path)
+    feeds = select_feeds(config, feed_names)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    with Reposter(config, feeds) as reposter:
+        schedule_paths = {name: feed_state.schedule_path for name, feed_state in reposter.feed_states.items()}
+        scheduler = FeedScheduler(
+            feeds,
+            interval_minutes=config["poll_interval_minutes"],
+            jitter_seconds=config["poll_jitter_seconds"],
+            min_minutes=config["poll_min_minutes"],
+            max_minutes=config["poll_max_minutes"],
+            budget_per_hour=config["poll_budget_per_hour"],
+            half_life_hours=config["poll_half_life_hours"],
+            stats={name: load_schedule(path) for name, path in schedule_paths.items()},
+        )
+
+        while not stop.is_set():
+            due = scheduler.pop_due()
+            if due:
+                try:
+                    pending_feeds, published_times = reposter.run(due)
+                except Exception as err:
+                    # Keep the daemon alive, the feeds are tried again at their next poll. The
+                    # validators of the feeds were already updated by the fetch, so they are
+                    # dropped: otherwise the feeds that were not processed would answer 304.
+                    print(f"Run of {', '.join(due)} failed: {err!r}")
+                    for name in due:
+                        reposter.fetcher.invalidate(reposter.feeds[name]["subreddit_rss_url"])
+                    pending_feeds, published_times = [], {}
+                for name in due:
+                    scheduler.observe(name, published_times.get(name))
+                    if name in scheduler.stats:
+                        save_schedule(scheduler.stats[name], schedule_paths[name])
+                for name in due:
+                    interval = scheduler.min_interval if name in pending_feeds else None
+                    scheduler.reschedule(name, interval=interval)
+                    rate = scheduler.rate(name)
+                    if rate is not None:
+                        print(f"[{name}] ~{rate:.2f} new entries/hour, next poll in {scheduler.intervals[name] / 60:.0f} min")
+
+            next_due = scheduler.next_due()
+            if next_due is None:
+                print("No feed to poll")
+                break
+            stop.wait(max(0, next_due - time.time()))
+
+    print("Stopped")
@@ -0,0 +1,162 @@
+"""
+In-process scheduler of the feeds for the daemon mode (see repost.run_daemon).
+
+Every poll time gets a random delay of up to `poll_jitter_seconds`, so that feeds do not all
+hit reddit at the same second. The next poll times are kept in a heap, so finding the feeds
+that are due is cheap whatever the number of feeds.
+
+A feed with its own `poll_interval_minutes` in bots.json is polled at that fixed interval.
+The other feeds start at the global `poll_interval_minutes` and then adapt to how often their
+subreddit posts: after every poll the scheduler counts the entries published since the
+previous poll and keeps an exponentially decayed total of the entries seen and of the time
+observed (half-life `poll_half_life_hours`), whose ratio is the posting rate of the feed. A
+feed is then polled about once per new entry, between `poll_min_minutes` and
+`poll_max_minutes`, and when the feeds together would exceed `poll_budget_per_hour` requests,
+the adaptive intervals are stretched to fit in the budget.
+"""
+import heapq
+import random
+import time
+
+
+class FeedScheduler:
+    def __init__(
+        self,
+        feeds,
+        interval_minutes=30,
+        jitter_seconds=60,
+        min_minutes=5,
+        max_minutes=360,
+        budget_per_hour=None,
+        half_life_hours=24,
+        stats=None,
+        clock=time.time,
+    ):
+        """
+        feeds: Feed entries of bots.json (a feed may set a fixed `poll_interval_minutes`)
+        interval_minutes: Time between two polls of a feed until its posting rate is known
+        jitter_seconds: Maximum random delay added to every poll time
+        min_minutes, max_minutes: Bounds of the adaptive intervals
+        budget_per_hour: Maximum number of polls per hour of all the feeds together (None: no limit)
+        half_life_hours: Half-life of the past observations in the posting rate
+        stats: The `stats` attribute of a previous scheduler, to keep the learned rates across restarts
+        clock: Function returning the current time in seconds
+        """
+        self.jitter_seconds = jitter_seconds
+        self.min_interval = 60 * min_minutes
+        self.max_interval = 60 * max_minutes
+        self.budget_per_hour = budget_per_hour
+        self.half_life = 3600 * half_life_hours
+        self.clock = clock
+
+        self.fixed = {feed["name"] for feed in feeds if "poll_interval_minutes" in feed}
+        self.intervals = {
+            feed["name"]: 60 * feed.get("poll_interval_minutes", interval_minutes)
+            for feed in feeds
+        }
+        # name -> {"events": decayed number of entries, "exposure": decayed seconds observed,
+        #          "last_poll": time of the last poll}
+        # A feed without a saved schedule yet has empty stats
+        self.stats = {name: dict(feed_stats) for name, feed_stats in (stats or {}).items() if name in self.intervals and feed_stats}
+        self._update_intervals()
+
+        # The first polls are spread over the jitter window instead of all happening at once
+        now = self.clock()
+        self._heap = [(now + self._jitter(), name) for name in self.intervals]
+        heapq.heapify(self._heap)
+
+    def _jitter(self):
+        return random.uniform(0, self.jitter_seconds)
+
+    def rate(self, name):
+        """
+        Estimated number of new entries per hour of the feed `name`, or None if unknown
+        """
+        feed_stats = self.stats.get(name)
+        if not feed_stats or feed_stats["exposure"] <= 0:
+            return None
+        return 3600 * feed_stats["events"] / feed_stats["exposure"]
+
+    def observe(self, name, published_times, now=None):
+        """
+        Record a poll of the feed `name`. `published_times` holds the published times (epoch
+        seconds) of the entries of the feed, is empty if the feed was not modified, and None
+        if it could not be fetched (nothing is learned then).
+        """
+        if published_times is None:
+            return
+        now = self.clock() if now is None else now
+        feed_stats = self.stats.setdefault(name, {"events": 0.0, "exposure": 0.0, "last_poll": None})
+        last_poll = feed_stats["last_poll"]
+        feed_stats["last_poll"] = now
+
+        published_times = sorted(published_times)
+        if last_poll is None or (len(published_times) >= 2 and published_times[0] > last_poll):
+            # First poll, or more new entries than the feed holds: estimate the rate from the
+            # time spanned by the entries
+            if len(published_times) < 2:
+                return
+            events = len(published_times) - 1
+            exposure = now - published_times[0]
+        else:
+            events = sum(1 for t in published_times if t > last_poll)
+            exposure = now - last_poll
+        if exposure <= 0:
+            return
+
+        decay = 0.5 ** (exposure / self.half_life)
+        feed_stats["events"] = feed_stats["events"] * decay + events
+        feed_stats["exposure"] = feed_stats["exposure"] * decay + exposure
+        self._update_intervals()
+
+    def _update_intervals(self):
+        adaptive = []
+        for name in self.intervals:
+            if name in self.fixed:
+                continue
+            rate = self.rate(name)
+            if rate is None:
+                continue
+            # About one new entry per poll
+            interval = 3600 / rate if rate > 0 else self.max_interval
+            self.intervals[name] = min(max(interval, self.min_interval), self.max_interval)
+            adaptive.append(name)
+
+        if self.budget_per_hour is None or not adaptive:
+            return
+
+        # Stretch the adaptive intervals so that all the feeds together fit in the budget
+        fixed_polls = sum(3600 / self.intervals[name] for name in self.intervals if name not in adaptive)
+        adaptive_polls = sum(3600 / self.intervals[name] for name in adaptive)
+        available = self.budget_per_hour - fixed_polls
+        if available <= 0:
+            for name in adaptive:
+                self.intervals[name] = self.max_interval
+        elif adaptive_polls > available:
+            for name in adaptive:
+                self.intervals[name] *= adaptive_polls / available
+
+    def next_due(self):
+        """
+        Time of the next poll, or None if there is no feed to poll
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """
+        Remove and return the names of the feeds whose poll time has come
+        """
+        now = self.clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def reschedule(self, name, interval=None, now=None):
+        """
+        Schedule the next poll of `name`, `interval` seconds (default: the feed's interval) from now
+        """
+        now = self.clock() if now is None else now
+        if interval is None:
+            interval = self.intervals[name]
+        heapq.heappush(self._heap, (now + interval + self._jitter(), name))
@@ -0,0 +1,164 @@
+"""
+Lemmy session reused across runs.
+
+Logging in on every run costs a round trip, and the login endpoint is rate limited on many
+instances. LemmySession keeps the JWT in `session.json` and reuses it until it expires
+(`session_ttl_hours` after the login); it only logs in again when there is no valid token or
+when the instance rejects it (401, see Publisher). The file holds the JWT, so it is written
+readable by its owner only and is never uploaded as an artifact.
+
+The ids of the communities are kept in `communities.json` for `community_ttl_hours`. The
+communities that are not known yet are looked up together, concurrently over a pooled
+requests.Session, rather than one discover_community() call per feed.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pythorhead import Lemmy
+
+from feeds import USER_AGENT
+
+
+def _load_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class LemmySession:
+    def __init__(
+        self,
+        instance_url,
+        username,
+        password,
+        session_path="state/session.json",
+        communities_path="state/communities.json",
+        ttl_hours=24 * 7,
+        community_ttl_hours=24,
+        max_workers=8,
+        timeout=15,
+    ):
+        """
+        instance_url: Url of the lemmy instance
+        username, password: Credentials of the bot account
+        session_path: File keeping the JWT between runs
+        communities_path: File keeping the community ids between runs
+        ttl_hours: How long a JWT is reused after the login
+        community_ttl_hours: How long a community id is reused before being looked up again
+        max_workers: Maximum number of community lookups at the same time
+        timeout: Timeout (in seconds) of a single lookup
+        """
+        self.instance_url = instance_url
+        self.username = username
+        self.password = password
+        self.session_path = session_path
+        self.communities_path = communities_path
+        self.ttl = 3600 * ttl_hours
+        self.community_ttl = 3600 * community_ttl_hours
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        self.lemmy = Lemmy(instance_url)
+        self.http = requests.Session()
+        self.http.headers["User-Agent"] = USER_AGENT
+
+        session = _load_json(session_path)
+        if (
+            session.get("instance_url") == instance_url
+            and session.get("username") == username
+            and session.get("jwt")
+            and session.get("expires", 0) > time.time()
+        ):
+            print("Reusing the saved Lemmy session")
+            self.lemmy._requestor._auth.set_token(session["jwt"])
+        else:
+            self.log_in()
+
+        communities = _load_json(communities_path)
+        self.communities = communities.get("communities", {}) if communities.get("instance_url") == instance_url else {}
+
+    def log_in(self):
+        """
+        Log in with the credentials and save the new JWT. Returns False if the login failed.
+        """
+        print("Logging in to Lemmy")
+        if not self.lemmy.log_in(self.username, self.password):
+            print("Could not log in to Lemmy")
+            return False
+
+        session = {
+            "instance_url": self.instance_url,
+            "username": self.username,
+            "jwt": self.lemmy._requestor._auth.token,
+            "expires": time.time() + self.ttl,
+        }
+        directory = os.path.dirname(self.session_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.session_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(session, f)
+
+        return True
+
+    def _lookup_community(self, name):
+        try:
+            res = self.http.get(
+                f"{self.lemmy._requestor._auth.api_url}/community",
+                params={"name": name},
+                timeout=self.timeout,
+            )
+            res.raise_for_status()
+            return res.json()["community_view"]["community"]["id"]
+        except (requests.RequestException, ValueError, KeyError) as err:
+            print(f"Could not look up community '{name}': {err}")
+            return None
+
+    def community_ids(self, names):
+        """
+        Return a dict of name -> community id (None if it could not be found) for `names`,
+        looking up the ones that are not cached, or expired, together
+        """
+        now = time.time()
+        names = list(dict.fromkeys(names))
+        missing = [
+            name for name in names
+            if name not in self.communities or self.communities[name]["expires"] <= now
+        ]
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                for name, community_id in zip(missing, executor.map(self._lookup_community, missing)):
+                    if community_id is not None:
+                        self.communities[name] = {"id": community_id, "expires": now + self.community_ttl}
+            self.save_communities()
+
+        return {
+            name: self.communities[name]["id"] if name in self.communities else None
+            for name in names
+        }
+
+    def forget_community(self, community_id):
+        """
+        Drop the cached name of `community_id`, e.g. when the instance no longer knows it
+        """
+        names = [name for name, community in self.communities.items() if community["id"] == community_id]
+        for name in names:
+            del self.communities[name]
+        if names:
+            self.save_communities()
+
+    def save_communities(self):
+        directory = os.path.dirname(self.communities_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.communities_path, "w") as f:
+            json.dump({"instance_url": self.instance_url, "communities": self.communities}, f, indent=2)
+
+    def close(self):
+        self.http.close()
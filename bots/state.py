@@ -0,0 +1,326 @@
+"""
+Stores of the reddit entries that were already published to lemmy.
+
+Both stores replace published_urls.json: instead of reading and rewriting the whole file on
+every run, each published entry is persisted as soon as it is posted, so the cost of a run
+grows with the new entries only and a crash halfway through posting does not lose them.
+
+- PublishedUrlStore (*.db): SQLite database in WAL mode. Lookups are point queries on the
+  primary key, expiring old entries is a single DELETE on the published_time index, and
+  several bots can read and write the same database at once.
+- PublishedUrlJournal (*.jsonl): append-only JSON-lines file with one fsync'd record per
+  published entry, streamed at startup into a compact DedupIndex (see dedup.py) and
+  compacted from time to time.
+
+Use open_published_url_store() to pick the store matching a path.
+
+The state of every feed lives in its own directory (FeedState), e.g. state/til/, holding its
+published URLs store, feed_cache.json, last_date_published.txt and, in daemon mode, the posting
+rate learned by the scheduler (schedule.json). Bots running in parallel
+each touch only their own directory, and each directory can be loaded, flushed and uploaded
+on its own.
+"""
+import datetime as dt
+import json
+import os
+import sqlite3
+
+from dedup import DedupIndex, hash_permalink
+
+
+def to_epoch(published_time):
+    """
+    Convert an ISO 8601 string (as found in the published element of a feed entry) or a
+    datetime to epoch seconds (which are returned as is)
+    """
+    if isinstance(published_time, int):
+        return published_time
+    if isinstance(published_time, str):
+        published_time = dt.datetime.fromisoformat(published_time)
+    if published_time.tzinfo is None:
+        published_time = published_time.replace(tzinfo=dt.timezone.utc)
+
+    return int(published_time.timestamp())
+
+
+class PublishedUrlStore:
+    def __init__(self, path="published_urls.db", timeout=30):
+        """
+        path: Path to the SQLite database (created if it does not exist)
+        timeout: How long (in seconds) to wait for another bot holding the write lock
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS published_urls ("
+            "link TEXT PRIMARY KEY, "
+            "published_time INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS published_urls_published_time "
+            "ON published_urls (published_time)"
+        )
+
+    def __contains__(self, link):
+        row = self.conn.execute(
+            "SELECT 1 FROM published_urls WHERE link = ?", (link,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM published_urls").fetchone()[0]
+
+    def add(self, link, published_time):
+        """
+        Record `link` as published. `published_time` is in epoch seconds, or an ISO timestamp or a datetime.
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO published_urls (link, published_time) VALUES (?, ?)",
+            (link, to_epoch(published_time)),
+        )
+
+    def items(self):
+        """
+        Iterate over the (link, published time in epoch seconds) of the store
+        """
+        return iter(self.conn.execute("SELECT link, published_time FROM published_urls").fetchall())
+
+    def import_items(self, items):
+        """
+        Import (link, published time in epoch seconds) pairs, keeping the entries already stored
+        """
+        rows = list(items)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO published_urls (link, published_time) VALUES (?, ?)",
+                rows,
+            )
+
+        return len(rows)
+
+    def import_dict(self, published_urls_dict):
+        """
+        Import a {link: {"published_time": ...}} dict, as stored in the old published_urls.json
+        """
+        return self.import_items(
+            (link, to_epoch(entry["published_time"]))
+            for link, entry in published_urls_dict.items()
+        )
+
+    def remove_older_than(self, limit_hours=24):
+        """
+        Remove entries that are older than `limit_hours` hours. Returns the number of removed entries.
+        """
+        dt_now = dt.datetime.now(dt.timezone.utc)
+        cutoff = to_epoch(dt_now - dt.timedelta(hours=limit_hours))
+
+        cursor = self.conn.execute(
+            "DELETE FROM published_urls WHERE published_time <= ?", (cutoff,)
+        )
+        return cursor.rowcount
+
+    def checkpoint(self):
+        """
+        Copy the committed transactions of the WAL into the database file, without blocking
+        """
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        # Fold the WAL back into the database file, so it can be uploaded as a single file
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PublishedUrlJournal:
+    def __init__(self, path="published_urls.jsonl", compact_ratio=2, use_bloom=False):
+        """
+        path: Path to the journal (created if it does not exist)
+        compact_ratio: Rewrite the journal once it holds `compact_ratio` times more records than live entries
+        use_bloom: Put a Bloom filter in front of the index (see dedup.DedupIndex)
+        """
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.published = DedupIndex(use_bloom=use_bloom)
+        self._records = 0
+
+        complete = self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if not complete:
+            # Start the next record on its own line, after the truncated one
+            self._file.write("\n")
+
+    def _load(self):
+        """
+        Stream the journal into memory. Returns False if the last record is truncated.
+        """
+        line = "\n"
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash in the middle of a write can leave a truncated last line
+                        continue
+                    self.published.add(record["link"], record["published_time"])
+                    self._records += 1
+        except FileNotFoundError:
+            pass
+
+        return line.endswith("\n")
+
+    def __contains__(self, link):
+        return link in self.published
+
+    def __len__(self):
+        return len(self.published)
+
+    def _append(self, records):
+        for link, published_time in records:
+            self._file.write(json.dumps({"link": link, "published_time": published_time}) + "\n")
+            self._records += 1
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def add(self, link, published_time):
+        """
+        Record `link` as published. `published_time` is in epoch seconds, or an ISO timestamp or a datetime.
+        """
+        published_time = to_epoch(published_time)
+        self.published.add(link, published_time)
+        self._append([(link, published_time)])
+
+    def items(self):
+        """
+        Iterate over the (link, published time in epoch seconds) of the store. The index only
+        holds hashes, so the live records are streamed from the journal.
+        """
+        self._file.flush()
+        written = set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                h = hash_permalink(record["link"])
+                if h in written or self.published.published_time(record["link"]) != record["published_time"]:
+                    continue
+                written.add(h)
+                yield record["link"], record["published_time"]
+
+    def import_items(self, items):
+        """
+        Import (link, published time in epoch seconds) pairs, keeping the entries already stored
+        """
+        records = [(link, published_time) for link, published_time in items if link not in self.published]
+        for link, published_time in records:
+            self.published.add(link, published_time)
+        self._append(records)
+
+        return len(records)
+
+    def import_dict(self, published_urls_dict):
+        """
+        Import a {link: {"published_time": ...}} dict, as stored in the old published_urls.json
+        """
+        return self.import_items(
+            (link, to_epoch(entry["published_time"]))
+            for link, entry in published_urls_dict.items()
+        )
+
+    def remove_older_than(self, limit_hours=24):
+        """
+        Remove entries that are older than `limit_hours` hours. Returns the number of removed entries.
+        """
+        dt_now = dt.datetime.now(dt.timezone.utc)
+        cutoff = to_epoch(dt_now - dt.timedelta(hours=limit_hours))
+
+        expired = self.published.remove_older_than(cutoff)
+
+        if self._records > self.compact_ratio * len(self.published):
+            self.compact()
+
+        return expired
+
+    def compact(self):
+        """
+        Rewrite the journal with only the live entries (atomically, through a temporary file)
+        """
+        tmp_path = f"{self.path}.tmp"
+        records = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for link, published_time in self.items():
+                f.write(json.dumps({"link": link, "published_time": published_time}) + "\n")
+                records += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._records = records
+
+    def checkpoint(self):
+        # Every record is already fsync'd when it is appended
+        pass
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_published_url_store(path="published_urls.db", use_bloom=False):
+    """
+    Open the store matching the extension of `path`: a PublishedUrlJournal for *.jsonl files
+    (with a Bloom filter in front of its index if `use_bloom` is set), a PublishedUrlStore
+    (SQLite) otherwise
+    """
+    if path.endswith(".jsonl"):
+        return PublishedUrlJournal(path, use_bloom=use_bloom)
+
+    return PublishedUrlStore(path)
+
+
+class FeedState:
+    def __init__(self, root, name, store_file="published_urls.db", use_bloom=False):
+        """
+        root: Directory holding the state of every feed
+        name: Name of the feed (its state is kept in root/name)
+        store_file: File name of the published URLs store (see open_published_url_store)
+        use_bloom: Put a Bloom filter in front of the index of a journal store
+        """
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.store_path = os.path.join(self.dir, store_file)
+        self.feed_cache_path = os.path.join(self.dir, "feed_cache.json")
+        self.last_published_path = os.path.join(self.dir, "last_date_published.txt")
+        self.schedule_path = os.path.join(self.dir, "schedule.json")
+
+        self.is_new = not os.path.exists(self.store_path)
+        os.makedirs(self.dir, exist_ok=True)
+        self.published_urls = open_published_url_store(self.store_path, use_bloom=use_bloom)
+
+    def close(self):
+        self.published_urls.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
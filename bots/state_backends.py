@@ -0,0 +1,153 @@
+"""
+Backends persisting the state partitions of the feeds (see state.FeedState).
+
+The bots always work on the partitions in `state_dir`; a backend only decides where they are
+restored from before a run and persisted to after it:
+
+- LocalDirBackend ("local"): `state_dir` is the persistent storage itself (e.g. the disk of
+  the host running the daemon), so there is nothing to restore or persist.
+- ArtifactZipBackend ("artifact_zip"): every partition is mirrored as `<name>.zip` with its
+  content hash in `<name>.sha256` in `state_mirror_dir`, the directory a workflow downloads
+  and uploads as an artifact. A partition is only extracted when its hash differs from the
+  mirror's, and only zipped again when its content changed during the run. The workflows
+  read `state_changed` from $GITHUB_OUTPUT to skip the upload of an unchanged mirror.
+
+The hash leaves out last_date_published.txt, which is rewritten on every run, and session.json,
+which must never leave the host.
+"""
+import hashlib
+import os
+import zipfile
+
+
+# Files of a partition that do not count as a change of its content
+UNHASHED_FILES = ("last_date_published.txt",)
+# Files that are never mirrored
+PRIVATE_FILES = ("session.json",)
+
+
+def hash_dir(path):
+    """
+    sha256 of the names and contents of the files of a partition, or None if it does not exist
+    """
+    if not os.path.isdir(path):
+        return None
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name in UNHASHED_FILES or name in PRIVATE_FILES:
+                continue
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode("utf-8") + b"\0")
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+class LocalDirBackend:
+    def __init__(self, root):
+        """
+        root: Directory holding the state of every feed
+        """
+        self.root = root
+
+    def restore(self, name):
+        pass
+
+    def persist(self, name):
+        return False
+
+    def finish(self):
+        pass
+
+
+class ArtifactZipBackend:
+    def __init__(self, root, mirror_dir="state_mirror"):
+        """
+        root: Directory holding the state of every feed
+        mirror_dir: Directory holding the zip and the hash of every partition
+        """
+        self.root = root
+        self.mirror_dir = mirror_dir
+        self.changed = []
+
+    def _paths(self, name):
+        base = os.path.join(self.mirror_dir, name)
+        return f"{base}.zip", f"{base}.sha256"
+
+    def _mirror_hash(self, name):
+        _, hash_path = self._paths(name)
+        try:
+            with open(hash_path, "r") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def restore(self, name):
+        """
+        Extract the mirrored partition `name`, unless the local one already has the same content
+        """
+        zip_path, _ = self._paths(name)
+        part_dir = os.path.join(self.root, name)
+        mirror_hash = self._mirror_hash(name)
+
+        if mirror_hash is not None and os.path.exists(zip_path) and mirror_hash != hash_dir(part_dir):
+            print(f"[{name}] Restoring the state from {zip_path}")
+            os.makedirs(part_dir, exist_ok=True)
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                zip_ref.extractall(part_dir)
+
+    def persist(self, name):
+        """
+        Mirror the partition `name` if its content changed. Returns whether it was written.
+        """
+        zip_path, hash_path = self._paths(name)
+        part_dir = os.path.join(self.root, name)
+        new_hash = hash_dir(part_dir)
+
+        if new_hash is None or new_hash == self._mirror_hash(name):
+            print(f"[{name}] State unchanged, not mirrored")
+            return False
+
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        tmp_path = f"{zip_path}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            for root, _, files in os.walk(part_dir):
+                for file_name in sorted(files):
+                    if file_name in PRIVATE_FILES:
+                        continue
+                    file_path = os.path.join(root, file_name)
+                    zip_ref.write(file_path, os.path.relpath(file_path, part_dir))
+        os.replace(tmp_path, zip_path)
+        with open(hash_path, "w") as f:
+            f.write(new_hash)
+
+        self.changed.append(name)
+        print(f"[{name}] State mirrored to {zip_path}")
+        return True
+
+    def finish(self):
+        """
+        Report whether any partition changed to the workflow (as the `state_changed` output)
+        """
+        output = os.environ.get("GITHUB_OUTPUT")
+        if output:
+            with open(output, "a") as f:
+                f.write(f"state_changed={'true' if self.changed else 'false'}\n")
+
+
+def open_state_backend(kind, root, mirror_dir="state_mirror"):
+    """
+    Create the backend named `kind` ("local" or "artifact_zip")
+    """
+    if kind == "local":
+        return LocalDirBackend(root)
+    if kind == "artifact_zip":
+        return ArtifactZipBackend(root, mirror_dir)
+
+    raise ValueError(f"Unknown state backend: {kind}")
@@ -0,0 +1,158 @@
+"""
+Extraction of the links of a reddit feed entry summary.
+
+format_and_extract() turns the <a> tags of an entry summary into the markdown body of the
+lemmy post, and returns the url of the shared link ("[link]"). Building a full BeautifulSoup
+tree with html.parser for every entry is slow, so the summary is first scanned by a small
+tokenizer that only looks at the tags. Anything the tokenizer is not sure to read exactly
+like html.parser (comments, CDATA, stray "<", unusual entities, anchors not starting with text, ...) falls back
+to BeautifulSoup, so the output is always the same as format_and_extract_bs4().
+"""
+import html
+import re
+
+from bs4 import BeautifulSoup
+
+
+_ATTR = r"""\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>`]+))?"""
+_TAG_RE = re.compile(
+    rf"""<(?:([a-zA-Z][a-zA-Z0-9]*)((?:{_ATTR})*)\s*(/?)>|/[a-zA-Z][a-zA-Z0-9]*\s*>|!-- SC_O(?:FF|N) -->)"""
+)
+_ATTR_RE = re.compile(r"""\s+([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+))?""")
+# Character references that BeautifulSoup decodes exactly like html.unescape()
+_SAFE_REF_RE = re.compile(r"&(?:#([0-9]{1,7})|#[xX]([0-9a-fA-F]{1,6})|(?:amp|lt|gt|quot|apos|nbsp));")
+# Elements whose content html.parser may not parse as markup (depending on the Python version)
+_CDATA_TAGS = ("script", "style", "textarea", "title", "xmp", "iframe", "noembed", "noframes", "noscript", "plaintext")
+
+
+def _format_link(first_child, url):
+    """
+    Markdown line for a link, and whether it is the shared link
+    """
+    if first_child == "[link]":
+        return f"- [Link Shared on Reddit]({url})\n", True
+    elif first_child == "[comments]":
+        text = "Original Reddit Comments"
+    elif first_child.startswith("/u/"):
+        text = f"Author: {first_child}"
+    else:
+        if first_child.startswith("["):
+            first_child = first_child[1:]
+        if first_child.endswith("]"):
+            first_child = first_child[:-1]
+        text = html.unescape(first_child)
+
+    return f"- [{text}]({url})\n", False
+
+
+def _unescape_text(text):
+    """
+    Decode the character references of a text node like BeautifulSoup does, or return None if
+    the text holds references it decodes differently than html.unescape() (unknown entities,
+    missing semicolons, control characters, ...)
+    """
+    if "&" not in text:
+        return text
+
+    refs = list(_SAFE_REF_RE.finditer(text))
+    if len(refs) != text.count("&"):
+        return None
+    for ref in refs:
+        dec, hexa = ref.group(1, 2)
+        if dec is None and hexa is None:
+            continue
+        codepoint = int(dec) if dec is not None else int(hexa, 16)
+        if not (codepoint in (9, 10, 13) or 32 <= codepoint < 127 or 160 <= codepoint < 0xD800):
+            return None
+
+    return html.unescape(text)
+
+
+def format_and_extract_bs4(summary):
+    soup = BeautifulSoup(summary, features="html.parser")
+    links = soup.find_all("a")
+
+    extracted_url = None
+    formatted = ""
+
+    for link in links:
+        first_child = next(link.children).strip()
+        url = link.get("href")
+
+        line, shared = _format_link(first_child, url)
+        if shared:
+            extracted_url = url
+
+        formatted += line
+
+    return formatted, extracted_url
+
+
+def _scan_links(summary):
+    """
+    Return the (href, first child text) of every <a> tag of `summary`, or None if the summary
+    holds markup that must be left to html.parser
+    """
+    links = []
+    pos = 0
+    while True:
+        start = summary.find("<", pos)
+        if start == -1:
+            return links
+
+        m = _TAG_RE.match(summary, start)
+        if m is None:
+            return None
+
+        tag, attrs, self_closing = m.group(1, 2, 3)
+        pos = m.end()
+        if tag is None:
+            continue
+
+        tag = tag.lower()
+        if tag in _CDATA_TAGS:
+            return None
+        if tag != "a":
+            continue
+        if self_closing:
+            return None
+
+        end = summary.find("<", pos)
+        if end == -1:
+            end = len(summary)
+        if end == pos:
+            # The first child of the anchor is a tag (or the anchor is empty)
+            return None
+
+        href = None
+        for name, value in _ATTR_RE.findall(attrs):
+            if name.lower() != "href":
+                continue
+            if value[:1] in ("'", '"'):
+                value = value[1:-1]
+            href = html.unescape(value)
+
+        text = _unescape_text(summary[pos:end])
+        if text is None:
+            return None
+
+        links.append((href, text))
+        pos = end
+
+
+def format_and_extract(summary):
+    links = _scan_links(summary)
+    if links is None:
+        return format_and_extract_bs4(summary)
+
+    extracted_url = None
+    formatted = ""
+
+    for url, first_child in links:
+        line, shared = _format_link(first_child.strip(), url)
+        if shared:
+            extracted_url = url
+
+        formatted += line
+
+    return formatted, extracted_url
@@ -0,0 +1,168 @@
+"""
+Title filters of the feeds.
+
+The title rules of a feed (see `title_rules` in bots.json) are compiled once into a
+TitleFilter: every keyword and whole word, included or excluded, goes into a single
+Aho-Corasick automaton, so a title is scanned once whatever the number of rules, and the
+regexes are joined into one alternation for the excluded ones and one for the included ones.
+
+    "title_rules": {
+        "exclude_keywords": ["how", "?"],         # substring, case insensitive
+        "exclude_words": ["ama"],                 # whole word, case insensitive
+        "exclude_regex": ["^\\[meta\\]"],         # re.search, case insensitive
+        "include_keywords": [],                   # if any include rule is given,
+        "include_words": [],                      # the title must match one of them
+        "include_regex": []
+    }
+"""
+import json
+import functools
+import re
+from collections import deque
+
+
+RULE_KEYS = (
+    "exclude_keywords",
+    "exclude_words",
+    "exclude_regex",
+    "include_keywords",
+    "include_words",
+    "include_regex",
+)
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        """
+        patterns: Strings to look for. Matches are reported by index in `patterns`.
+        """
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(i)
+
+        # Breadth-first construction of the failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """
+        Yield (start, end, pattern index) for every occurrence of the patterns in `text`
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for i in out[state]:
+                yield pos + 1 - len(self.patterns[i]), pos + 1, i
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class TitleFilter:
+    def __init__(self, rules=None):
+        """
+        rules: Dict with the lists of `RULE_KEYS` (all optional)
+        """
+        rules = rules or {}
+        unknown = set(rules) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown title rule(s): {', '.join(sorted(unknown))}")
+
+        # (pattern, is excluded, is whole word) for every entry of the automaton
+        self._rules = []
+        for key in ("exclude_keywords", "exclude_words", "include_keywords", "include_words"):
+            for pattern in rules.get(key, []):
+                pattern = pattern.lower()
+                if pattern:
+                    self._rules.append((pattern, key.startswith("exclude"), key.endswith("_words")))
+        self._automaton = AhoCorasick(pattern for pattern, _, _ in self._rules)
+
+        self._exclude_regex = self._compile(rules.get("exclude_regex", []))
+        self._include_regex = self._compile(rules.get("include_regex", []))
+        self._has_include = self._include_regex is not None or any(
+            not excluded for _, excluded, _ in self._rules
+        )
+
+    @staticmethod
+    def _compile(regexes):
+        if not regexes:
+            return None
+        return re.compile("|".join(f"(?:{regex})" for regex in regexes), re.IGNORECASE)
+
+    def reject_reason(self, title):
+        """
+        Return why `title` is filtered out (e.g. "keyword 'how'"), or None if it is kept
+        """
+        lowered = title.lower()
+        included = False
+
+        for start, end, i in self._automaton.iter_matches(lowered):
+            pattern, excluded, whole_word = self._rules[i]
+            if whole_word and (
+                (start > 0 and _is_word_char(lowered[start - 1]))
+                or (end < len(lowered) and _is_word_char(lowered[end]))
+            ):
+                continue
+            if excluded:
+                return f"{'word' if whole_word else 'keyword'} '{pattern}'"
+            included = True
+
+        if self._exclude_regex is not None:
+            match = self._exclude_regex.search(title)
+            if match:
+                return f"regex match '{match.group(0)}'"
+
+        if self._has_include and not included:
+            if self._include_regex is None or not self._include_regex.search(title):
+                return "no include rule matched"
+
+        return None
+
+
+def merge_title_rules(*rule_sets):
+    """
+    Concatenate the lists of several rule dicts (e.g. the global and the per-feed rules)
+    """
+    merged = {}
+    for rules in rule_sets:
+        for key, patterns in (rules or {}).items():
+            merged.setdefault(key, []).extend(patterns)
+
+    return merged
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_title_filter(rules_json):
+    return TitleFilter(json.loads(rules_json))
+
+def compile_title_filter(rules):
+    """
+    Return the TitleFilter of `rules`, compiled only once for identical rules
+    """
+    return _compile_title_filter(json.dumps(rules, sort_keys=True))
@@ -5,12 +5,33 @@
 #   -H "Authorization: Bearer <YOUR-TOKEN>" \
 #   -H "X-GitHub-Api-Version: 2022-11-28" \
 #   https://api.github.com/repos/OWNER/REPO/actions/artifacts
-import urllib.request
+#
+# All the API calls go through a single keep-alive connection to api.github.com. The archive
+# itself is served from a storage host GitHub redirects to: it is streamed in chunks, either to
+# a temporary file renamed into place once complete, or into a spooled temporary file (kept in
+# memory up to SPOOL_SIZE) that is extracted directly, so memory use does not grow with the
+# size of the artifact.
+#
+# Several artifacts can be restored at once (--artifact_name NAME[=SAVE_DIR] ...): the latest
+# artifact of every name is looked up with its own filtered listing (?name=...&per_page=1), and
+# the lookups and the downloads run concurrently.
+from concurrent.futures import ThreadPoolExecutor
+import http.client
 import json
+import os
+import shutil
+import tempfile
+import threading
 from pathlib import Path
+from urllib.parse import quote, urlsplit
 import zipfile
 
 
+API_HOST = 'api.github.com'
+CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
 class Repository:
     def __init__(self, token, owner, repo):
         """
@@ -21,7 +42,101 @@ class Repository:
         self.token = token
         self.owner = owner
         self.repo = repo
-    
+        # One keep-alive connection per thread, so that downloads can run concurrently
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+
+    def _headers(self):
+        return {
+            'Accept': 'application/vnd.github+json',
+            'Authorization': f'Bearer {self.token}',
+            'X-GitHub-Api-Version': '2022-11-28',
+            'User-Agent': f'{self.owner}/{self.repo}',
+        }
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(API_HOST, timeout=60)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _request(self, path, headers=None):
+        """
+        GET `path` on api.github.com over the keep-alive connection of the current thread. The
+        response must be read entirely before the next request.
+        """
+        headers = {**self._headers(), **(headers or {})}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('GET', path, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server closed the idle connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def _get_json_bytes(self, path):
+        res = self._request(path)
+        body = res.read()
+        if res.status != 200:
+            raise RuntimeError(f'GET {path} failed with {res.status}: {body[:200]!r}')
+        return body
+
+    def _get_json(self, path):
+        return json.loads(self._get_json_bytes(path))
+
+    def _open_archive(self, artifact_id, archive_format='zip'):
+        """
+        Start downloading the archive of an artifact. Returns the connection and the response
+        to stream the archive from. The Authorization header is only sent to api.github.com, not
+        to the storage host of the redirect.
+        """
+        path = f'/repos/{self.owner}/{self.repo}/actions/artifacts/{artifact_id}/{archive_format}'
+        res = self._request(path)
+        if res.status == 200:
+            return None, res
+
+        res.read()
+        location = res.getheader('Location')
+        if res.status not in (301, 302, 303, 307, 308) or not location:
+            raise RuntimeError(f'GET {path} failed with {res.status}')
+
+        url = urlsplit(location)
+        conn_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        conn = conn_class(url.netloc, timeout=60)
+        target = url.path + (f'?{url.query}' if url.query else '')
+        conn.request('GET', target, headers={'User-Agent': f'{self.owner}/{self.repo}'})
+        res = conn.getresponse()
+        if res.status != 200:
+            conn.close()
+            raise RuntimeError(f'Download of artifact {artifact_id} failed with {res.status}')
+        return conn, res
+
+    def _stream_archive(self, artifact_id, f, archive_format='zip'):
+        """
+        Write the archive of an artifact to the file object `f`, chunk by chunk
+        """
+        conn, res = self._open_archive(artifact_id, archive_format)
+        try:
+            shutil.copyfileobj(res, f, CHUNK_SIZE)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def close(self):
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns = []
+        self._local = threading.local()
+
     def list_artifacts(self, per_page=30, page=1, name=None):
         """
         per_page: The number of results per page (max 100).
@@ -33,19 +148,11 @@ class Repository:
         if per_page < 1:
             raise ValueError('per_page must be greater than 0.')
         
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Authorization': f'Bearer {self.token}',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-
-        url = f'https://api.github.com/repos/{self.owner}/{self.repo}/actions/artifacts?per_page={per_page}&page={page}'
+        path = f'/repos/{self.owner}/{self.repo}/actions/artifacts?per_page={per_page}&page={page}'
         if name:
-            url += f'&name={name}'
-        
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as res:
-            body = json.loads(res.read())
+            path += f'&name={quote(name)}'
+
+        body = self._get_json(path)
         
         return body
 
@@ -55,17 +162,7 @@ class Repository:
         can use this endpoint. If the repository is private you must use an access token with 
         the repo scope. GitHub Apps must have the actions:read permission to use this endpoint.
         """
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Authorization': f'Bearer {self.token}',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-
-        url = f'https://api.github.com/repos/{self.owner}/{self.repo}/actions/artifacts/{artifact_id}'
-        
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as res:
-            body = json.loads(res.read())
+        body = self._get_json(f'/repos/{self.owner}/{self.repo}/actions/artifacts/{artifact_id}')
         
         return body
 
@@ -81,36 +178,97 @@ class Repository:
         save_name: Name of the file to save the artifact to. By default, the artifact ID and archive format are used.
         overwrite: Whether to overwrite the file if it already exists. If overwrite=False, will stop and give a warning. Default: False
         """
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Authorization': f'Bearer {self.token}',
-            'X-GitHub-Api-Version': '2022-11-28'
-        }
-
-        url = f'https://api.github.com/repos/{self.owner}/{self.repo}/actions/artifacts/{artifact_id}/{archive_format}'
-        
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as res:
-            body = res.read()  # body is a bytes object, we need to write it to a file
-
         if save_name is None:
             save_name = f'{artifact_id}.{archive_format}'
         save_dir = Path(save_dir)
         save_dir.mkdir(parents=True, exist_ok=True)
         save_path = save_dir / save_name
         
-        if save_path.exists():
-            if overwrite:
-                save_path.unlink()
-            else:
-                print(f'File {save_path} already exists. Skipping download.')
-                return save_path
+        if save_path.exists() and not overwrite:
+            print(f'File {save_path} already exists. Skipping download.')
+            return save_path
 
-        with open(save_path, 'wb') as f:
-            f.write(body)
+        # Stream to a temporary file next to the destination, and only move it into place once
+        # complete, so an interrupted download never leaves a truncated archive behind
+        fd, tmp_path = tempfile.mkstemp(dir=save_dir, prefix=f'.{save_name}.', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self._stream_archive(artifact_id, f, archive_format)
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
         
         return save_path
 
+    def download_and_extract_artifact(self, artifact_id, save_dir='./gh_artifacts', overwrite=False):
+        """
+        Downloads the zip archive of an artifact into a spooled temporary file (in memory up to
+        SPOOL_SIZE, on disk beyond) and extracts it to a directory, without saving the archive.
+
+        artifact_id: The artifact ID
+        save_dir: Directory to extract the contents of the archive to
+        overwrite: Whether to overwrite the files that already exist
+        """
+        save_dir = Path(save_dir)
+        save_dir.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            self._stream_archive(artifact_id, f)
+            f.seek(0)
+            with zipfile.ZipFile(f, 'r') as zip_ref:
+                _extract_members(zip_ref, save_dir, overwrite)
+
+        return save_dir
+
+    def resolve_artifacts(self, names, max_workers=8):
+        """
+        Finds the latest artifact of every name in `names`, with one filtered listing per name,
+        concurrently. Returns a dict of name -> artifact (None if there is no such artifact, or
+        if the latest one has expired).
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        def latest(name):
+            artifacts = self.list_artifacts(per_page=1, page=1, name=name)['artifacts']
+            if not artifacts:
+                return None
+            if artifacts[0].get('expired'):
+                print(f'The latest artifact with name {name} has expired.')
+                return None
+            return artifacts[0]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as executor:
+            return dict(zip(names, executor.map(latest, names)))
+
+    def restore_artifacts(self, save_dirs, overwrite=True, max_workers=8):
+        """
+        Downloads and extracts the latest artifact of several names concurrently.
+
+        save_dirs: Dict of artifact name -> directory to extract it to
+        overwrite: Whether to overwrite the files that already exist
+        max_workers: Maximum number of simultaneous lookups and downloads
+        Returns the names of the artifacts that were restored.
+        """
+        artifacts = self.resolve_artifacts(save_dirs, max_workers=max_workers)
+        for name, artifact in artifacts.items():
+            if artifact is None:
+                print(f'No artifacts found with name {name}. Skipping.')
+        todo = [(name, artifact) for name, artifact in artifacts.items() if artifact is not None]
+        if not todo:
+            return []
+
+        def restore(item):
+            name, artifact = item
+            self.download_and_extract_artifact(artifact['id'], save_dir=save_dirs[name], overwrite=overwrite)
+            print(f'Restored {name} to {save_dirs[name]}')
+            return name
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as executor:
+            return list(executor.map(restore, todo))
+
     def extract_artifact(self, path, save_dir='./gh_artifacts', use_name_as_subdir=True, overwrite=False):
         """
         Extracts the contents of a zip file and save to a directory.
@@ -130,53 +288,52 @@ class Repository:
         save_dir.mkdir(parents=True, exist_ok=True)
 
         with zipfile.ZipFile(path, 'r') as zip_ref:
-            for member in zip_ref.namelist():
-                filename = Path(member)
-
-                if filename.is_dir():
-                    continue
-                
-                if use_name_as_subdir:
-                    filename = save_dir / filename
-                else:
-                    filename = save_dir / path.stem / filename
-                
-                if filename.exists():
-                    if overwrite:
-                        filename.unlink()
-                    else:
-                        print(f'File {filename} already exists. Skipping extraction.')
-                        continue
-                
-                filename.parent.mkdir(parents=True, exist_ok=True)
-                zip_ref.extract(member, save_dir)
+            _extract_members(zip_ref, save_dir, overwrite)
         
         return save_dir
 
 
+def _extract_members(zip_ref, save_dir, overwrite=False):
+    """
+    Extracts the files of an open zip archive to save_dir, skipping (or overwriting) the
+    files that already exist
+    """
+    for member in zip_ref.infolist():
+        if member.is_dir():
+            continue
+
+        filename = save_dir / member.filename
+        if filename.exists():
+            if overwrite:
+                filename.unlink()
+            else:
+                print(f'File {filename} already exists. Skipping extraction.')
+                continue
+
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        zip_ref.extract(member, save_dir)
+
+
 if __name__ == '__main__':
     import argparse
-    import os
     
     parser = argparse.ArgumentParser(description='Download the latest artifact from a GitHub repository.')
     parser.add_argument('--token', type=str, help='GitHub Personal Access Token', required=True)
     parser.add_argument('--owner', type=str, help='GitHub repository owner', required=True)
     parser.add_argument('--repo', type=str, help='GitHub repository name', required=True)
-    parser.add_argument('--artifact_name', type=str, help='Name of the artifact to download')
-    parser.add_argument('--save_dir', type=str, default='./gh_artifacts', help='Directory to save the artifact to')
+    parser.add_argument('--artifact_name', type=str, nargs='+', required=True,
+                        help='Names of the artifacts to download, each optionally followed by =SAVE_DIR')
+    parser.add_argument('--save_dir', type=str, default='./gh_artifacts', help='Directory to save the artifacts to')
 
     args = parser.parse_args()
 
-    repo = Repository(args.token, args.owner, args.repo)
-    
-    # Let's get the latest artifact (always the first one, so we can use per_page=1, page=1)
-    artifacts = repo.list_artifacts(per_page=1, page=1, name=args.artifact_name)
+    save_dirs = {}
+    for value in args.artifact_name:
+        name, _, save_dir = value.partition('=')
+        save_dirs[name] = save_dir or args.save_dir
 
-    if len(artifacts['artifacts']) == 0:
-        print(f'No artifacts found with name {args.artifact_name}. Exiting.')
-        exit(0)
-
-    # Download the artifact and extract the content to the current directory, overwriting any existing files
-    a = artifacts['artifacts'][0]
-    artifact_path = repo.download_artifact(a['id'], overwrite=True)
-    repo.extract_artifact(artifact_path, use_name_as_subdir=False, overwrite=True, save_dir=args.save_dir)
+    # Resolve the artifacts, then download and extract them concurrently, overwriting any
+    # existing files
+    repo = Repository(args.token, args.owner, args.repo)
+    repo.restore_artifacts(save_dirs, overwrite=True)
+    repo.close()
@@ -0,0 +1,103 @@
+"""
+Benchmark of DedupIndex (dedup.py) against the dict of published_urls.json it replaces, a
+{link: {"published_time": ISO timestamp}} dict of the full permalinks.
+
+For every structure it builds an index of `--entries` permalinks and reports the memory it
+holds (measured with tracemalloc, which also slows down the reported build time) and the
+average time of a lookup, for links it holds and for links it does not:
+
+    python tests/bench_dedup.py --entries 1000000
+"""
+import argparse
+import datetime as dt
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "bots"))
+
+from dedup import DedupIndex
+
+
+def permalinks(count, offset=0):
+    return [
+        f"https://www.reddit.com/r/todayilearned/comments/{i + offset:x}/til_post_number_{i + offset}/"
+        for i in range(count)
+    ]
+
+
+def build_dict(links, published_times):
+    return {
+        link: {"published_time": dt.datetime.fromtimestamp(published_time, dt.timezone.utc).isoformat()}
+        for link, published_time in zip(links, published_times)
+    }
+
+
+def build_index(links, published_times, use_bloom):
+    index = DedupIndex(use_bloom=use_bloom)
+    for link, published_time in zip(links, published_times):
+        index.add(link, published_time)
+    # Merge the pending entries, as the first lookup would
+    _ = links[0] in index
+    return index
+
+
+def measure(build):
+    """
+    Build a structure, returning it with the memory it holds (in bytes) and the build time
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size, elapsed
+
+
+def lookup_time(structure, links):
+    """
+    Average time (in seconds) of a membership test
+    """
+    start = time.perf_counter()
+    for link in links:
+        _ = link in structure
+    return (time.perf_counter() - start) / len(links)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000, help="Number of permalinks to index")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Number of lookups of each kind")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    links = permalinks(args.entries)
+    now = int(time.time())
+    published_times = [now - rng.randint(0, 24 * 3600) for _ in links]
+    hits = rng.sample(links, min(args.lookups, len(links)))
+    misses = permalinks(args.lookups, offset=args.entries)
+
+    # The dict holds the permalinks it was loaded with, while the index only keeps their hashes
+    candidates = (
+        ("dict (published_urls.json)", lambda: build_dict(permalinks(args.entries), published_times)),
+        ("DedupIndex", lambda: build_index(links, published_times, use_bloom=False)),
+        ("DedupIndex + Bloom filter", lambda: build_index(links, published_times, use_bloom=True)),
+    )
+
+    print(f"{args.entries} entries, {len(hits)} hits and {len(misses)} misses looked up")
+    print(f"{'structure':<28}{'memory':>12}{'build':>10}{'hit':>10}{'miss':>10}")
+    for name, build in candidates:
+        structure, size, elapsed = measure(build)
+        hit = lookup_time(structure, hits)
+        miss = lookup_time(structure, misses)
+        print(f"{name:<28}{size / 2 ** 20:>10.1f}MB{elapsed:>9.1f}s{hit * 1e6:>8.2f}us{miss * 1e6:>8.2f}us")
+        del structure
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bots are plain scripts importing each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "bots"))
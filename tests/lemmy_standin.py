@@ -0,0 +1,162 @@
+"""
+Local stand-in for the parts of the Lemmy API used by bot_del_req.py, served over HTTP on a
+free port of 127.0.0.1.
+
+It keeps the comments of a few communities in memory and answers the login, the comment
+list of a community, the mentions and replies of the bot (newest first, paginated with `limit`
+and `page`), the user lookup, the creation of comments and the deletion of posts. Every
+request is recorded in `requests`, as (method, path, query or JSON body).
+"""
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+BOT_ID = 1
+TOKEN = "standin-jwt"
+
+
+class LemmyStandIn:
+    def __init__(self, bot_name="partybot"):
+        self.bot_name = bot_name
+        self.comments = []
+        self.mentions = []
+        self.replies = []
+        self.deleted_posts = set()
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/v3"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_comment(self, post_id, creator_id, content, community="botland", published=None):
+        """
+        Add a comment to a post of `community`, published now or at the datetime `published`.
+        A comment mentioning the bot in full (@partybot@instance) also lands in the mentions
+        of the bot.
+        """
+        published = published or datetime.now(timezone.utc)
+        with self._lock:
+            comment_view = {
+                "comment": {
+                    "id": len(self.comments) + 1,
+                    "content": content,
+                    "creator_id": creator_id,
+                    "post_id": post_id,
+                    "published": published.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                },
+                "creator": {"id": creator_id, "name": f"user{creator_id}"},
+                "post": {"id": post_id, "deleted": post_id in self.deleted_posts},
+                "community": {"name": community},
+            }
+            self.comments.append(comment_view)
+            if f"@{self.bot_name}@" in content:
+                self.mentions.append(dict(comment_view, person_mention={"id": len(self.mentions) + 1}))
+
+        return comment_view
+
+    def add_reply(self, post_id, creator_id, content, community="botland", published=None):
+        """
+        Add a comment replying to a comment of the bot
+        """
+        comment_view = self.add_comment(post_id, creator_id, content, community, published)
+        with self._lock:
+            self.replies.append(dict(comment_view, comment_reply={"id": len(self.replies) + 1}))
+
+        return comment_view
+
+    def calls(self, path):
+        """
+        The recorded requests to `path`
+        """
+        return [request for request in self.requests if request[1] == path]
+
+    def _page(self, items, item_id, query):
+        limit = int(query.get("limit", 10))
+        page = int(query.get("page", 1))
+        items = sorted(items, key=item_id, reverse=True)
+        return items[(page - 1) * limit:page * limit]
+
+    def _get(self, path, query):
+        if path == "/api/v3/comment/list":
+            comments = [c for c in self.comments if c["community"]["name"] == query.get("community_name")]
+            return 200, {"comments": self._page(comments, lambda c: c["comment"]["id"], query)}
+        if path == "/api/v3/user/mention":
+            return 200, {"mentions": self._page(self.mentions, lambda m: m["person_mention"]["id"], query)}
+        if path == "/api/v3/user/replies":
+            return 200, {"replies": self._page(self.replies, lambda r: r["comment_reply"]["id"], query)}
+        if path == "/api/v3/user":
+            person_id = int(query["person_id"])
+            return 200, {"person_view": {"person": {"id": person_id, "name": f"user{person_id}"}}}
+
+        return 404, {"error": "not_found"}
+
+    def _post(self, path, body):
+        if path == "/api/v3/comment":
+            self.add_comment(body["post_id"], BOT_ID, body["content"])
+            return 200, {}
+        if path == "/api/v3/post/delete":
+            self.deleted_posts.add(body["post_id"])
+            return 200, {}
+
+        return 404, {"error": "not_found"}
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self):
+                return self.headers.get("Authorization") == f"Bearer {TOKEN}"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                standin.requests.append(("GET", url.path, query))
+                if not self._authorized():
+                    return self._send(401, {"error": "not_logged_in"})
+                self._send(*standin._get(url.path, query))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                standin.requests.append(("POST", url.path, body))
+                if url.path == "/api/v3/user/login":
+                    return self._send(200, {"jwt": TOKEN})
+                if not self._authorized():
+                    return self._send(401, {"error": "not_logged_in"})
+                self._send(*standin._post(url.path, body))
+
+        return Handler
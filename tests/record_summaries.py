@@ -0,0 +1,73 @@
+"""
+Record the summaries of the configured feeds into tests/data/reddit_summaries.jsonl, the corpus
+of test_summary.py.
+
+Both the new and the hot listing of every subreddit of bots.json are fetched, and their
+summaries are merged into the ones already recorded, without duplicates. Run it from the root
+of the repository, from time to time, so the corpus follows what reddit serves:
+
+    python tests/record_summaries.py
+"""
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "bots"))
+
+from feeds import FeedFetcher
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "reddit_summaries.jsonl")
+LISTING_RE = re.compile(r"/(new|hot|top|rising)/\.rss$")
+
+
+def listing_urls(config_path="bots.json"):
+    """
+    The new and hot feeds of every subreddit of the configuration
+    """
+    with open(config_path, "r") as f:
+        feeds = json.load(f)["feeds"]
+
+    urls = []
+    for feed in feeds:
+        base = LISTING_RE.sub("/", feed["subreddit_rss_url"])
+        urls += [f"{base}new/.rss", f"{base}hot/.rss"]
+    return urls
+
+
+def load_summaries(path=CORPUS_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def main():
+    summaries = load_summaries()
+    known = set(summaries)
+
+    fetcher = FeedFetcher()
+    try:
+        parsed_feeds = fetcher.fetch_all(listing_urls())
+    finally:
+        fetcher.close()
+
+    for url, parsed_feed in parsed_feeds.items():
+        if parsed_feed is None:
+            print(f"Could not fetch {url}")
+            continue
+        for entry in parsed_feed.entries:
+            if entry.summary not in known:
+                known.add(entry.summary)
+                summaries.append(entry.summary)
+
+    with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+        for summary in summaries:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    print(f"{len(summaries)} summaries in {CORPUS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
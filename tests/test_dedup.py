@@ -0,0 +1,117 @@
+"""
+DedupIndex (dedup.py) and PublishedUrlJournal (state.py) against a plain dict of link ->
+published time, over random sequences of adds, lookups and expiries.
+"""
+import random
+import time
+
+import pytest
+
+from dedup import DedupIndex
+from state import PublishedUrlJournal
+
+
+LINKS = [f"https://www.reddit.com/r/til/comments/{i}/post/" for i in range(3000)]
+
+
+def expire(reference, cutoff):
+    expired = [link for link, published_time in reference.items() if published_time <= cutoff]
+    for link in expired:
+        del reference[link]
+    return len(expired)
+
+
+@pytest.mark.parametrize("use_bloom", (False, True))
+@pytest.mark.parametrize("seed", range(10))
+def test_index_matches_dict(use_bloom, seed):
+    rng = random.Random(seed)
+    index = DedupIndex(use_bloom=use_bloom)
+    reference = {}
+    # Entries published at or before the latest cutoff are expired as soon as they are added
+    cutoff = -1
+    now = 1_000_000
+
+    for step in range(3000):
+        op = rng.random()
+        if op < 0.6:
+            now += rng.randint(0, 30)
+            link = rng.choice(LINKS)
+            published_time = now - rng.choice((0, 0, 0, 5000, 50000))
+            index.add(link, published_time)
+            if published_time > cutoff:
+                reference[link] = published_time
+            else:
+                reference.pop(link, None)
+        elif op < 0.65:
+            new_cutoff = now - rng.randint(0, 20000)
+            removed = index.remove_older_than(new_cutoff)
+            if new_cutoff > cutoff:
+                assert removed == expire(reference, new_cutoff)
+                cutoff = new_cutoff
+            else:
+                assert removed == 0
+        else:
+            link = rng.choice(LINKS)
+            assert (link in index) == (link in reference)
+            assert index.published_time(link) == reference.get(link)
+
+        if step % 100 == 0:
+            assert len(index) == len(reference)
+
+    assert len(index) == len(reference)
+    for link in LINKS:
+        assert index.published_time(link) == reference.get(link)
+
+
+@pytest.mark.parametrize("use_bloom", (False, True))
+@pytest.mark.parametrize("seed", range(3))
+def test_journal_survives_compact_and_reload(tmp_path, use_bloom, seed):
+    rng = random.Random(seed)
+    path = str(tmp_path / "published_urls.jsonl")
+    links = LINKS[:500]
+    reference = {}
+    limit_hours = 24
+    now = int(time.time())
+    cutoff = now - limit_hours * 3600
+    # Once expired, the entries added at or before the cutoff are expired right away
+    expired_once = False
+
+    journal = PublishedUrlJournal(path, use_bloom=use_bloom)
+    for step in range(2000):
+        op = rng.random()
+        if op < 0.8:
+            link = rng.choice(links)
+            # Far enough from the cutoff that it does not move an entry across it during the test
+            published_time = now - rng.choice((rng.randint(0, 20 * 3600), rng.randint(30 * 3600, 48 * 3600)))
+            journal.add(link, published_time)
+            if expired_once and published_time <= cutoff:
+                reference.pop(link, None)
+            else:
+                reference[link] = published_time
+        elif op < 0.85:
+            journal.remove_older_than(limit_hours=limit_hours)
+            expire(reference, cutoff)
+            expired_once = True
+        elif op < 0.87:
+            journal.compact()
+        elif op < 0.9:
+            # Like a new run: reload, then expire the old entries
+            journal.close()
+            journal = PublishedUrlJournal(path, use_bloom=use_bloom)
+            journal.remove_older_than(limit_hours=limit_hours)
+            expire(reference, cutoff)
+            expired_once = True
+        else:
+            link = rng.choice(links)
+            assert (link in journal) == (link in reference)
+
+    journal.remove_older_than(limit_hours=limit_hours)
+    expire(reference, cutoff)
+    journal.compact()
+    journal.close()
+
+    with PublishedUrlJournal(path, use_bloom=use_bloom) as reloaded:
+        assert len(reloaded) == len(reference)
+        assert dict(reloaded.items()) == reference
+        for link in links:
+            assert (link in reloaded) == (link in reference)
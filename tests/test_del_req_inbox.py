@@ -0,0 +1,129 @@
+"""
+bot_del_req.py in inbox mode against the local stand-in Lemmy API (see lemmy_standin.py)
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import bot_del_req
+from del_votes import DeleteVoteLedger
+from lemmy_standin import LemmyStandIn
+
+
+@pytest.fixture
+def lemmy(tmp_path, monkeypatch):
+    # The ledger is created in the working directory
+    monkeypatch.chdir(tmp_path)
+    with LemmyStandIn() as standin:
+        monkeypatch.setattr(bot_del_req, "LEMMY_API_BASE_URL", standin.base_url)
+        # Start the ledger while the inbox is empty
+        bot_del_req.monitor_community("inbox")
+        yield standin
+
+
+def high_waters():
+    with DeleteVoteLedger(bot_del_req.LEDGER_PATH) as ledger:
+        return ledger.high_water("max_mention_id"), ledger.high_water("max_reply_id")
+
+
+def bot_replies(lemmy):
+    """
+    (post id, number of votes still needed) of the replies of the bot, None for an
+    acknowledgement of a request
+    """
+    replies = []
+    for _, _, body in lemmy.calls("/api/v3/comment"):
+        content = body["content"]
+        remaining = int(content.split(". ")[1].split()[0]) if content.startswith("Request to delete") else None
+        replies.append((body["post_id"], remaining))
+    return replies
+
+
+def test_high_water_marks(lemmy):
+    lemmy.add_comment(40, 5, "@partybot@lemmy.ca deleteThis!")
+    lemmy.add_reply(40, 6, "@partybot deleteThis!")
+    lemmy.add_reply(41, 7, "@partybot@lemmy.ca deleteThis!")
+
+    bot_del_req.monitor_community("inbox")
+    assert high_waters() == (2, 2)
+    # The reply mentioning the bot is in both listings, but only acknowledged once
+    assert bot_replies(lemmy) == [(40, None), (40, None), (41, None), (40, 1), (41, 2)]
+
+    # Nothing new: one page of each listing and no acknowledgement
+    requests_before = len(lemmy.requests)
+    bot_del_req.monitor_community("inbox")
+    new_requests = [request[1] for request in lemmy.requests[requests_before:]]
+    assert sorted(new_requests) == ["/api/v3/user/login", "/api/v3/user/mention", "/api/v3/user/replies"]
+    assert high_waters() == (2, 2)
+
+    # Only the items above the marks are handled
+    lemmy.add_reply(41, 8, "@partybot deleteThis!")
+    bot_del_req.monitor_community("inbox")
+    assert high_waters() == (2, 3)
+    assert bot_replies(lemmy)[5:] == [(41, None), (41, 1)]
+
+
+def test_other_communities_are_dropped(lemmy):
+    lemmy.add_reply(50, 5, "@partybot deleteThis!", community="elsewhere")
+    lemmy.add_comment(50, 6, "@partybot@lemmy.ca deleteThis!", community="elsewhere")
+    lemmy.add_reply(51, 7, "@partybot deleteThis!")
+
+    bot_del_req.monitor_community("inbox")
+
+    with DeleteVoteLedger(bot_del_req.LEDGER_PATH) as ledger:
+        assert ledger.vote_count(50) == 0
+        assert ledger.vote_count(51) == 1
+    assert bot_replies(lemmy) == [(51, None), (51, 2)]
+    # The marks still move past the dropped items, so they are not listed again
+    assert high_waters() == (1, 2)
+
+
+def test_third_vote_deletes_the_post(lemmy):
+    lemmy.add_comment(60, 5, "@partybot@lemmy.ca deleteThis!")
+    lemmy.add_reply(60, 6, "@partybot deleteThis!")
+    bot_del_req.monitor_community("inbox")
+    assert lemmy.deleted_posts == set()
+
+    # A second request of the same user is not a new vote
+    lemmy.add_reply(60, 6, "@partybot deleteThis!")
+    bot_del_req.monitor_community("inbox")
+    assert lemmy.deleted_posts == set()
+
+    lemmy.add_comment(60, 7, "@partybot@lemmy.ca deleteThis!")
+    bot_del_req.monitor_community("inbox")
+    assert lemmy.deleted_posts == {60}
+    assert len(lemmy.calls("/api/v3/post/delete")) == 1
+
+    with DeleteVoteLedger(bot_del_req.LEDGER_PATH) as ledger:
+        assert ledger.is_closed(60)
+
+
+def test_new_ledger_skips_the_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with LemmyStandIn() as lemmy:
+        monkeypatch.setattr(bot_del_req, "LEMMY_API_BASE_URL", lemmy.base_url)
+        for creator_id in (5, 6, 7):
+            lemmy.add_reply(70, creator_id, "@partybot@lemmy.ca deleteThis!")
+
+        bot_del_req.monitor_community("inbox")
+        assert high_waters() == (3, 3)
+        assert bot_replies(lemmy) == []
+
+        lemmy.add_reply(70, 8, "@partybot deleteThis!")
+        bot_del_req.monitor_community("inbox")
+        assert lemmy.deleted_posts == set()
+        assert bot_replies(lemmy) == [(70, None), (70, 2)]
+
+
+def test_expired_requests_are_ignored(lemmy):
+    expired = datetime.now(timezone.utc) - timedelta(days=bot_del_req.VOTE_TTL_DAYS + 1)
+    for creator_id in (5, 6):
+        lemmy.add_reply(80, creator_id, "@partybot deleteThis!", published=expired)
+    lemmy.add_reply(80, 7, "@partybot deleteThis!")
+
+    bot_del_req.monitor_community("inbox")
+
+    assert lemmy.deleted_posts == set()
+    with DeleteVoteLedger(bot_del_req.LEDGER_PATH) as ledger:
+        assert ledger.vote_count(80) == 1
+    assert bot_replies(lemmy) == [(80, None), (80, 2)]
@@ -0,0 +1,68 @@
+"""
+format_and_extract() must give the same body and shared link as format_and_extract_bs4() on
+every summary of tests/data/reddit_summaries.jsonl (link, image, video, gallery, crosspost and
+self posts in the markup of the reddit feeds; record_summaries.py adds the ones the configured
+feeds currently serve) and on the edge cases the tokenizer hands over to BeautifulSoup. A summary BeautifulSoup fails on (an anchor starting with a tag) must fail
+the same way.
+"""
+import json
+import os
+
+import pytest
+
+from summary import format_and_extract, format_and_extract_bs4
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "reddit_summaries.jsonl")
+
+EDGE_CASES = [
+    '',
+    'plain text',
+    '<a href="x">t</a>',
+    '<a>no href</a>',
+    '<a href>empty href</a>',
+    '<a href="1" href="2">dup</a>',
+    '<a href="x"></a>',
+    '<a href="x"/>',
+    '<a href="x"><b>b</b></a>',
+    '<a href="x">a < b</a>',
+    '<!-- <a href="c">c</a> --><a href="d">d</a>',
+    '<script><a href="s">s</a></script>',
+    '<a href="x">t',
+    '<a href="x">  [link]  </a>',
+    '<A Href="X">T</A>',
+    '<a href="x>y">q</a>',
+    '<a title=\'a>b\' href="u">z</a>',
+    '<a href="u">x &#32;[y]&#93;</a>',
+    '<a\nhref="u"\n>nl</a>',
+    '<abbr title="x">ab</abbr><a href="u">k</a>',
+    '<a href="u">/u/bob &amp; co</a>',
+    '<a href="u">[comments]</a><a href="v">[link]</a><a href="w">[link]</a>',
+    '<p>x</p><![CDATA[<a href="c">]]>',
+    '<a href="&lt;&gt;&quot;">ent</a>',
+    '<a href=u>unq</a>',
+    '<a href="u" data-x=\'1\'>dx</a>',
+    '<a href="u">&notanentity; &amp</a>',
+    '<a href="u">&#150; &#x2014; &#0; &#128512;</a>',
+    '<a href="u">&amp;amp; &nbsp;x</a>',
+    '<a href="u">&eacute;</a>',
+    '<a href="u">a&amp b</a>',
+    '<a href="u">x &#39;y&#39;</a>',
+]
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def outcome(extract, summary):
+    try:
+        return extract(summary)
+    except Exception as err:
+        return type(err)
+
+
+@pytest.mark.parametrize("summary", load_corpus() + EDGE_CASES)
+def test_matches_bs4(summary):
+    assert outcome(format_and_extract, summary) == outcome(format_and_extract_bs4, summary)